@@ -3,31 +3,60 @@
 Movie recommendation prompt evaluator
 """
 
+import argparse
 import json
 import os
-import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-from openai import OpenAI
-from dotenv import load_dotenv
+from utils.resilience import ResilientCaller, print_retry_report
+from utils.results import ResultSink
+from utils.structured import StructuredOutput, parse_json_output, print_validity_report
 from utils.tee_output import TeeOutput
 
-# Load environment variables
-load_dotenv()
-
 # Model configuration constants
 GENERATION_MODEL = "gpt-4.1-nano"  # Model used for generating movie recommendations
+EXAMPLE_RESERVOIR_SIZE = 2  # perfect and partial example results kept in memory per prompt
+STRUCTURED_REPAIR_ATTEMPTS = 1  # re-asks per invalid output for models without response_format support
 
 class MovieEvaluator:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-        # Load system prompts from files
-        self.system_prompts = self.load_system_prompts()
-
-        # Load test dataset
-        self.dataset = self.load_dataset()
+    def __init__(self, structured=False):
+        # Request JSON constrained to the movie schema (response_format) instead of free text
+        self.structured = structured
+
+    @cached_property
+    def client(self):
+        """OpenAI client, created (and the openai package imported) on first use"""
+        from openai import OpenAI
+        # Retries are handled by self.resilience, so the client must not retry on its own
+        return OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+    @cached_property
+    def resilience(self):
+        """Retries transient API failures (Retry-After aware, full-jitter backoff)"""
+        return ResilientCaller()
+
+    @cached_property
+    def structured_output(self):
+        """Requests schema-constrained JSON when enabled and counts invalid outputs per prompt"""
+        return StructuredOutput(enabled=self.structured, repair_attempts=STRUCTURED_REPAIR_ATTEMPTS)
+
+    @cached_property
+    def system_prompts(self):
+        """System prompts, loaded from files on first access"""
+        return self.load_system_prompts()
+
+    @cached_property
+    def dataset(self):
+        """Test dataset, loaded on first access"""
+        return self.load_dataset()
+
+    def preload(self):
+        """Load the prompts and dataset up front"""
+        for name in ('system_prompts', 'dataset'):
+            getattr(self, name)
 
     def load_system_prompts(self):
         """Load system prompts from separate files"""
@@ -49,14 +78,10 @@ class MovieEvaluator:
             return json.load(f)
 
     def validate_api_key(self):
-        """Validate OpenAI API key with a simple test call"""
+        """Validate OpenAI API key with a model lookup (no completion tokens spent)"""
         try:
             print("🔑 Validating OpenAI API key...")
-            response = self.client.chat.completions.create(
-                model=GENERATION_MODEL,
-                messages=[{"role": "user", "content": "Test"}],
-                max_tokens=5
-            )
+            self.client.models.retrieve(GENERATION_MODEL)
             print("✅ API key is valid!")
             return True
         except Exception as e:
@@ -66,68 +91,118 @@ class MovieEvaluator:
     def test_system_prompt(self, system_prompt_name, system_prompt, user_prompt):
         """Test a specific system prompt with user input"""
         try:
-            response = self.client.chat.completions.create(
-                model=GENERATION_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
+            def create(messages, **kwargs):
+                return self.resilience.call("generation", lambda: self.client.chat.completions.create(
+                    model=GENERATION_MODEL,
+                    messages=messages,
+                    max_tokens=500,
+                    temperature=0.7,
+                    **kwargs
+                ))
+
+            response = self.structured_output.generate(create, GENERATION_MODEL, [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ], system_prompt_name)
 
             result = response.choices[0].message.content
 
-            # Try to parse as JSON
-            try:
-                # Clean the result - sometimes API returns markdown code blocks
-                cleaned_result = result.strip()
-                if cleaned_result.startswith('```json'):
-                    cleaned_result = cleaned_result.replace('```json', '').replace('```', '').strip()
-                elif cleaned_result.startswith('```'):
-                    cleaned_result = cleaned_result.replace('```', '').strip()
-
-                parsed = json.loads(cleaned_result)
-                is_valid_json = True
-                has_3_movies = len(parsed.get('movies', [])) == 3
-                has_required_fields = all(
-                    'title' in movie and 'genre' in movie and 'reason' in movie
-                    for movie in parsed.get('movies', [])
-                )
-                quality_score = (is_valid_json + has_3_movies + has_required_fields) / 3
-            except json.JSONDecodeError as e:
-                print(f"     JSON Parse Error: {str(e)}")
-                print(f"     Raw response: {repr(result[:100])}...")
-                parsed = None
-                is_valid_json = False
-                has_3_movies = False
-                has_required_fields = False
-                quality_score = 0
-
             return {
                 'system_prompt_name': system_prompt_name,
                 'user_input': user_prompt,
                 'raw_output': result,
-                'parsed_json': parsed,
-                'is_valid_json': is_valid_json,
-                'has_3_movies': has_3_movies,
-                'has_required_fields': has_required_fields,
-                'quality_score': quality_score
+                **self.score_output(result, verbose=True)
             }
 
         except Exception as e:
             print(f"Error testing system prompt '{system_prompt_name}': {str(e)}")
             return None
 
-    def run_evaluation(self):
-        """Run complete evaluation"""
+    def score_output(self, result, verbose=False):
+        """Score a raw model output: valid JSON, exactly 3 movies, complete fields.
+
+        Pure function of the output, so stored outputs can be rescored offline.
+        """
+        # Try to parse as JSON
+        try:
+            # Markdown code blocks are only stripped when the output does not parse as is
+            parsed = parse_json_output(result)
+            is_valid_json = True
+            # Valid JSON that is not a {movies: [...]} object has no movies
+            movies = parsed.get('movies', []) if isinstance(parsed, dict) else []
+            movies = movies if isinstance(movies, list) else []
+            has_3_movies = len(movies) == 3
+            has_required_fields = bool(movies) and all(
+                isinstance(movie, dict) and 'title' in movie and 'genre' in movie and 'reason' in movie
+                for movie in movies
+            )
+            quality_score = (is_valid_json + has_3_movies + has_required_fields) / 3
+        except json.JSONDecodeError as e:
+            if verbose:
+                print(f"     JSON Parse Error: {str(e)}")
+                print(f"     Raw response: {repr((result or '')[:100])}...")
+            parsed = None
+            movies = []
+            is_valid_json = False
+            has_3_movies = False
+            has_required_fields = False
+            quality_score = 0
+
+        return {
+            'parsed_json': parsed,
+            'movies': movies,
+            'is_valid_json': is_valid_json,
+            'has_3_movies': has_3_movies,
+            'has_required_fields': has_required_fields,
+            'quality_score': quality_score
+        }
+
+    def run_evaluation(self, results_path=None):
+        """Run complete evaluation.
+
+        Results are streamed to results_path (JSON Lines) if given; only running
+        aggregates and a few example results per prompt are kept in memory.
+        """
         print("🎬 SYSTEM PROMPT EVALUATOR FOR MOVIE RECOMMENDATIONS")
         print("=" * 60)
         print("🎯 Testing different SYSTEM prompts with the SAME user inputs")
 
-        all_results = []
-        system_prompt_scores = {name: [] for name in self.system_prompts.keys()}
+        with ResultSink(results_path, perfect_threshold=1.0, reservoir_size=EXAMPLE_RESERVOIR_SIZE) as sink:
+            self._evaluate_grid(sink)
+        print_retry_report(self.resilience.report())
+        print_validity_report(self.structured_output.report(), self.structured_output.mode())
+
+        # Final summary
+        print("\n" + "=" * 60)
+        print("📊 FINAL SUMMARY - SYSTEM PROMPT COMPARISON")
+        print("=" * 60)
+
+        best_system_prompt = self.show_summary(sink.aggregates())
+        return best_system_prompt, sink.examples()
+
+    def show_summary(self, aggregates, names=None):
+        """Print per-prompt averages and success rates and return the best system prompt.
 
+        `aggregates` maps each system prompt to {'avg_score', 'success_rate', 'count'};
+        `names` are the candidates for the winner (default: the loaded system prompts).
+        """
+        for system_name, stats in aggregates.items():
+            print(f"\n🎯 {system_name.upper()}:")
+            print(f"   Average score: {stats['avg_score']:.2%}")
+            print(f"   Success rate (100%): {stats['success_rate']:.2%}")
+            print(f"   Test cases: {stats['count']}")
+
+        # Determine best system prompt
+        best_system_prompt = max(names if names is not None else self.system_prompts.keys(),
+                         key=lambda x: aggregates[x]['avg_score'] if x in aggregates else 0)
+        best_score = aggregates[best_system_prompt]['avg_score'] if best_system_prompt in aggregates else 0
+
+        print(f"\n🏆 WINNER: {best_system_prompt.upper()} with {best_score:.2%} average score")
+
+        return best_system_prompt
+
+    def _evaluate_grid(self, sink):
+        """Test every system prompt on every test case, recording results in the sink"""
         for i, test_case in enumerate(self.dataset['test_cases'], 1):
             user_prompt = test_case['user_input']
             print(f"\n📝 USER INPUT {i} ({test_case['category']}): {user_prompt}")
@@ -138,8 +213,7 @@ class MovieEvaluator:
 
                 result = self.test_system_prompt(system_name, system_prompt, user_prompt)
                 if result:
-                    all_results.append(result)
-                    system_prompt_scores[system_name].append(result['quality_score'])
+                    sink.add(system_name, dict(result, category=test_case['category']))
 
                     # Show result
                     print(f"✅ Valid JSON: {'Yes' if result['is_valid_json'] else 'No'}")
@@ -147,35 +221,15 @@ class MovieEvaluator:
                     print(f"✅ Complete fields: {'Yes' if result['has_required_fields'] else 'No'}")
                     print(f"📊 Score: {result['quality_score']:.2%}")
 
-                    if result['parsed_json'] and result['quality_score'] > 0:
+                    if result['movies'] and result['quality_score'] > 0:
                         print("🎭 Recommended movies:")
-                        for k, movie in enumerate(result['parsed_json'].get('movies', []), 1):
+                        for k, movie in enumerate(result['movies'], 1):
+                            if not isinstance(movie, dict):
+                                print(f"  {k}. {movie}")
+                                continue
                             print(f"  {k}. {movie.get('title', 'N/A')} ({movie.get('genre', 'N/A')})")
                             print(f"     Reason: {movie.get('reason', 'N/A')}")
 
-        # Final summary
-        print("\n" + "=" * 60)
-        print("📊 FINAL SUMMARY - SYSTEM PROMPT COMPARISON")
-        print("=" * 60)
-
-        for system_name, scores in system_prompt_scores.items():
-            if scores:
-                avg_score = sum(scores) / len(scores)
-                success_rate = sum(1 for s in scores if s == 1.0) / len(scores)
-                print(f"\n🎯 {system_name.upper()}:")
-                print(f"   Average score: {avg_score:.2%}")
-                print(f"   Success rate (100%): {success_rate:.2%}")
-                print(f"   Test cases: {len(scores)}")
-
-        # Determine best system prompt
-        best_system_prompt = max(system_prompt_scores.keys(),
-                         key=lambda x: sum(system_prompt_scores[x]) / len(system_prompt_scores[x]) if system_prompt_scores[x] else 0)
-        best_score = sum(system_prompt_scores[best_system_prompt]) / len(system_prompt_scores[best_system_prompt]) if system_prompt_scores[best_system_prompt] else 0
-
-        print(f"\n🏆 WINNER: {best_system_prompt.upper()} with {best_score:.2%} average score")
-
-        return best_system_prompt, all_results
-
     def show_best_system_prompt(self, best_system_prompt_name):
         """Show the best system prompt to use in the challenge"""
         print(f"\n📋 RECOMMENDED SYSTEM PROMPT FOR CHALLENGE: {best_system_prompt_name.upper()}")
@@ -213,8 +267,22 @@ class MovieEvaluator:
                     print("-" * 40)
 
 
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Evaluate movie recommendation system prompts with the OpenAI API")
+    parser.add_argument("--structured", action="store_true",
+                        help="request JSON constrained to the {movies: [{title, genre, reason}]} schema "
+                             "(response_format); models without support get bounded repair retries")
+    return parser.parse_args(argv)
+
+
 def main():
     """Main function"""
+    args = parse_args()
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Check OpenAI configuration
     if not os.getenv('OPENAI_API_KEY'):
         print("❌ Error: OPENAI_API_KEY not found in .env file")
@@ -222,10 +290,15 @@ def main():
         print("   OPENAI_API_KEY=sk-your_api_key_here")
         return
 
-    evaluator = MovieEvaluator()
+    evaluator = MovieEvaluator(structured=args.structured)
+
+    # Validate API key while the prompts and dataset are loaded
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        key_check = pool.submit(evaluator.validate_api_key)
+        evaluator.preload()
+        key_valid = key_check.result()
 
-    # Validate API key first
-    if not evaluator.validate_api_key():
+    if not key_valid:
         print("\n💡 Please check your OpenAI configuration and try again.")
         print("   1. Verify your API key and endpoint in portal")
         print("   2. Check your deployment name exists")
@@ -235,17 +308,19 @@ def main():
     # Create output file with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = f"results/evaluation_report_{timestamp}.txt"
+    results_file = f"results/evaluation_results_{timestamp}.jsonl"
 
     # Capture output to both console and file
     with TeeOutput(output_file):
-        best_system_prompt, results = evaluator.run_evaluation()
+        best_system_prompt, examples = evaluator.run_evaluation(results_file)
         evaluator.show_best_system_prompt(best_system_prompt)
-        evaluator.show_examples(results)
+        evaluator.show_examples(examples)
 
         print("\n✨ Evaluation completed! Use the winning system prompt for your challenge.")
         print("📋 Remember: This is a SYSTEM prompt - use it in the 'system' role, not 'user' role.")
 
     print(f"\n💾 Report saved to: {output_file}")
+    print(f"💾 Raw results saved to: {results_file}")
 
 
 if __name__ == "__main__":
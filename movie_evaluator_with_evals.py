@@ -4,23 +4,118 @@ Movie Recommendation Prompt Evaluator
 Uses OpenAI API directly for comprehensive prompt testing and analysis
 """
 
+import argparse
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-from dotenv import load_dotenv
+from utils.concurrency import AIMDLimiter, format_window, is_rate_limit_error, submit_ahead
+from utils.hedging import HedgePolicy, print_hedge_report
+from utils.planning import build_plan, estimate_tokens, print_plan
+from utils.resilience import ResilientCaller, is_quota_error, print_retry_report
+from utils.structured import StructuredOutput, parse_json_output, print_validity_report
 from utils.tee_output import TeeOutput
+from utils.tracing import enable_tracing, span
 
-# Load environment variables BEFORE importing evals
-load_dotenv()
+# Heavy imports (openai, dotenv) are deferred to the code paths that need them
+# so that --help and --plan return instantly.
 
 # Model configuration constants - Adjust based on your OpenAI plan
 GENERATION_MODEL = "gpt-4.1-nano"  
 JUDGE_MODEL = "gpt-4.1-nano" 
 
+# Completion limits per call type
+GENERATION_MAX_TOKENS = 500
+JUDGE_MAX_TOKENS = 500
+ANALYSIS_MAX_TOKENS = 400
+COMPARISON_MAX_TOKENS = 200
+PAIRWISE_MAX_TOKENS = 10  # "Winner: A" / "Winner: B"
+
 # Rate limiting configuration
 REQUEST_DELAY = 0.5  # seconds between requests (increase if hitting rate limits)
-MAX_RETRIES = 5       # maximum retry attempts for failed requests
+MAX_RETRIES = 5       # maximum attempts per API call (first try included)
+MAX_CONCURRENCY = 8   # upper bound of the adaptive concurrency window (1 = serial)
+INITIAL_CONCURRENCY = 2  # starting window; grows while latency is stable, halves on 429s/latency spikes
+GRID_LOOKAHEAD = 2    # cells submitted ahead of the one being reported, per worker (bounds memory)
+
+# Retry configuration (every API call; the openai client's own retries are disabled)
+RETRY_BASE_DELAY = 0.5      # seconds; without a Retry-After header, wait uniform(0, base * 2^attempt)
+RETRY_MAX_DELAY = 30.0      # cap on a single wait, including server-requested ones
+RETRY_BUDGET_RATIO = 0.2    # retries per stage may not exceed 20% of its calls...
+RETRY_BUDGET_MIN = 10       # ...plus this many
+BREAKER_THRESHOLD = 5       # consecutive transient failures that open a stage's circuit
+BREAKER_COOLDOWN = 30.0     # seconds the circuit stays open before a trial call
+
+# Offline rescoring configuration (rescore)
+RESCORE_CHUNK_BYTES = 8 * 1024 * 1024  # bytes of stored results handed to a worker process at a time
+
+# Load test configuration (loadtest)
+LOADTEST_DURATION = 60.0     # seconds of sustained load
+LOADTEST_MAX_IN_FLIGHT = 256 # open loop (--qps): requests in flight at once before new ones queue
+LOADTEST_TIMEOUT = 60.0      # seconds before a request counts as failed
+
+# Structured output configuration (--structured)
+STRUCTURED_REPAIR_ATTEMPTS = 1  # re-asks per invalid output for models without response_format support
+
+# Score aggregation configuration
+SAMPLES_PER_CELL = 1         # generations per (system prompt, test case); more samples = tighter CIs
+BOOTSTRAP_RESAMPLES = 1000   # bootstrap / permutation resamples
+CONFIDENCE_LEVEL = 0.95      # confidence level of the reported intervals
+SIGNIFICANCE_LEVEL = 0.05    # the winner must beat every other prompt at this level
+MAX_INDIVIDUAL_SCORES = 12   # individual scores listed per prompt in the results table
+
+# Result handling
+EXAMPLE_RESERVOIR_SIZE = 2  # perfect and partial example results kept in memory per prompt
+
+# Near-duplicate test case detection (MinHash/LSH over word shingles)
+DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity at which user inputs count as duplicates
+DEDUP_NUM_PERM = 64    # MinHash permutations
+
+# Hedged requests configuration (--hedge)
+HEDGE_PERCENTILE = 95           # hedge calls slower than this latency percentile of their stage
+HEDGE_MAX_EXTRA_FRACTION = 0.1  # at most this fraction of extra (duplicate) requests
+HEDGE_MIN_SAMPLES = 5           # latencies to observe before hedging starts
+
+# Successive-halving search configuration (--halving)
+HALVING_ETA = 2             # keep the best 1/HALVING_ETA of the prompts each round
+HALVING_MIN_PERSONAS = 1    # personas in the first round; multiplied by HALVING_ETA per round
+
+# Judge gate configuration (--gate)
+GATE_FLOOR_SCORE = 0.0  # score given without a judge call to outputs failing the structural heuristics
+                        # (the judge rubric's score for malformed or unusable responses)
+
+# Plan estimation configuration (--plan)
+MODEL_PRICING = {     # USD per 1M tokens
+    "gpt-4.1-nano": {"input": 0.10, "output": 0.40},
+}
+ESTIMATED_CALL_LATENCY = 3.0  # average seconds per API call
+
+
+def print_gate_report(report, floor=GATE_FLOOR_SCORE):
+    """Report the judge calls the structural gate skipped, per system prompt"""
+    checked = sum(stats['checked'] for stats in report.values())
+    if not checked:
+        return
+    skipped = sum(stats['skipped'] for stats in report.values())
+    print(f"\n🚧 JUDGE GATE: skipped {skipped} of {checked} judge calls ({skipped / checked:.0%}); "
+          f"outputs failing the structural checks scored {floor:.2f}")
+    for system_name, stats in sorted(report.items(), key=lambda item: -item[1]['skipped']):
+        print(f"   {str(system_name):<24} {stats['skipped']:>5} of {stats['checked']:<5} skipped")
+
+
+def print_dedup_summary(dataset):
+    """Report how many near-duplicate test cases were collapsed when the dataset was loaded"""
+    dedup = dataset.get('dedup')
+    if not dedup or dedup['original_count'] == len(dataset['test_cases']):
+        return
+    print(f"🧬 Near-duplicate test cases collapsed: {dedup['original_count']} → {len(dataset['test_cases'])} "
+          f"(Jaccard ≥ {dedup['threshold']}); scores are reweighted by cluster size")
+    for test_case in dataset['test_cases']:
+        if test_case['cluster_size'] > 1:
+            print(f"   • {test_case['category']}: represents {test_case['cluster_size']} test cases")
 
 
 class LLMJudgeEval:
@@ -29,16 +124,146 @@ class LLMJudgeEval:
     Uses one model to generate movie recommendations and another model to judge them.
     """
 
-    def __init__(self):
-        self.system_prompts = self.load_system_prompts()
-        self.judge_prompt = self.load_judge_prompt()
-        self.dataset = self.load_dataset()
-        # Load analysis prompts
-        self.judge_system_prompt = self.load_judge_system_prompt()
-        self.analysis_prompt_template = self.load_analysis_prompt_template()
-        self.analysis_system_prompt = self.load_analysis_system_prompt()
-        self.comparison_prompt_template = self.load_comparison_prompt_template()
-        self.comparison_system_prompt = self.load_comparison_system_prompt()
+    def __init__(self, hedge_policy=None, limiter=None, samples=SAMPLES_PER_CELL, dedup=True, pairwise=False,
+                 halving=False, resilience=None, structured=None, gate=False):
+        # Optional HedgePolicy applied to API calls
+        self.hedge_policy = hedge_policy
+        # Score outputs failing the structural heuristics GATE_FLOOR_SCORE instead of calling the judge
+        self.gate = gate
+        self._gate_stats = {}
+        self._gate_lock = threading.Lock()
+        # Optional StructuredOutput requesting schema-constrained JSON and counting invalid outputs
+        self.structured = structured
+        # Rank prompts per persona with a pairwise judge tournament instead of absolute scores
+        self.pairwise = pairwise
+        # Search the prompt pool with successive halving instead of evaluating the full grid
+        self.halving = halving
+        # Optional ResilientCaller retrying transient failures of every API call
+        self.resilience = resilience
+        # Number of generations (and judgements) per system prompt and test case
+        self.samples = samples
+        # Collapse near-duplicate test cases when the dataset is loaded
+        self.dedup = dedup
+        # Optional AIMDLimiter shared by every API call
+        self.limiter = limiter
+
+    # Prompt files and the dataset are loaded lazily on first access
+    @cached_property
+    def system_prompts(self):
+        return self.load_system_prompts()
+
+    @cached_property
+    def heuristics(self):
+        """PromptEval whose structural checks gate the judge calls"""
+        return PromptEval(dedup=self.dedup)
+
+    @cached_property
+    def judge_prompt(self):
+        return self.load_judge_prompt()
+
+    @cached_property
+    def dataset(self):
+        return self.load_dataset()
+
+    @cached_property
+    def judge_system_prompt(self):
+        return self.load_judge_system_prompt()
+
+    @cached_property
+    def pairwise_judge_prompt(self):
+        return self.load_pairwise_judge_prompt()
+
+    @cached_property
+    def pairwise_judge_system_prompt(self):
+        return self.load_pairwise_judge_system_prompt()
+
+    @cached_property
+    def analysis_prompt_template(self):
+        return self.load_analysis_prompt_template()
+
+    @cached_property
+    def analysis_system_prompt(self):
+        return self.load_analysis_system_prompt()
+
+    @cached_property
+    def comparison_prompt_template(self):
+        return self.load_comparison_prompt_template()
+
+    @cached_property
+    def comparison_system_prompt(self):
+        return self.load_comparison_system_prompt()
+
+    def preload(self):
+        """Load every prompt file and the dataset up front"""
+        for name in ('system_prompts', 'judge_prompt', 'dataset', 'judge_system_prompt',
+                     'pairwise_judge_prompt', 'pairwise_judge_system_prompt', 'analysis_prompt_template', 'analysis_system_prompt',
+                     'comparison_prompt_template', 'comparison_system_prompt'):
+            getattr(self, name)
+
+    def plan(self, concurrency=MAX_CONCURRENCY):
+        """Estimate calls, tokens, cost and wall time of a run without calling the API"""
+        from utils.ranking import max_comparisons
+
+        calls = []
+        judge_overhead = estimate_tokens(self.judge_system_prompt) + estimate_tokens(self.judge_prompt)
+        pairwise_overhead = (estimate_tokens(self.pairwise_judge_system_prompt)
+                             + estimate_tokens(self.pairwise_judge_prompt))
+
+        test_cases = self.dataset['test_cases']
+        if self.halving:
+            from utils.search import halving_schedule, stratified_order
+            # Upper bound: assume the longest prompts survive every round
+            longest_first = sorted(self.system_prompts.values(), key=estimate_tokens, reverse=True)
+            order = stratified_order([tc['category'] for tc in test_cases])
+            cells = {}
+            previous = 0
+            for candidates, items in halving_schedule(len(longest_first), len(test_cases),
+                                                      HALVING_ETA, HALVING_MIN_PERSONAS):
+                for t in order[previous:items]:
+                    cells[t] = longest_first[:candidates]
+                previous = items
+            grid_prompts = [cells.get(t, []) for t in range(len(test_cases))]
+        else:
+            grid_prompts = [list(self.system_prompts.values())] * len(test_cases)
+
+        for test_case, prompts in zip(test_cases, grid_prompts):
+            user_tokens = estimate_tokens(test_case['user_input'])
+            for system_prompt in prompts:
+                for _ in range(self.samples):
+                    calls.append({'stage': 'generation', 'model': GENERATION_MODEL,
+                                  'input_tokens': estimate_tokens(system_prompt) + user_tokens,
+                                  'output_tokens': GENERATION_MAX_TOKENS, 'delay': REQUEST_DELAY})
+                    if not self.pairwise:
+                        calls.append({'stage': 'judge', 'model': JUDGE_MODEL,
+                                      'input_tokens': judge_overhead + user_tokens + GENERATION_MAX_TOKENS,
+                                      'output_tokens': JUDGE_MAX_TOKENS})
+            if self.pairwise:
+                # One merge-sort tournament per persona and sample (worst-case comparisons)
+                for _ in range(self.samples * max_comparisons(len(self.system_prompts))):
+                    calls.append({'stage': 'pairwise', 'model': JUDGE_MODEL,
+                                  'input_tokens': pairwise_overhead + user_tokens + 2 * GENERATION_MAX_TOKENS,
+                                  'output_tokens': PAIRWISE_MAX_TOKENS})
+
+        # Analysis tail: one analysis of the winner and one comparison per other prompt
+        prompt_tokens = [estimate_tokens(p) for p in self.system_prompts.values()]
+        if prompt_tokens:
+            longest = max(prompt_tokens)
+            calls.append({'stage': 'analysis', 'model': JUDGE_MODEL, 'serial': True,
+                          'input_tokens': estimate_tokens(self.analysis_system_prompt)
+                          + estimate_tokens(self.analysis_prompt_template) + longest,
+                          'output_tokens': ANALYSIS_MAX_TOKENS})
+            comparison_overhead = (estimate_tokens(self.comparison_system_prompt)
+                                   + estimate_tokens(self.comparison_prompt_template))
+            for tokens in prompt_tokens[1:]:
+                calls.append({'stage': 'comparison', 'model': JUDGE_MODEL, 'serial': True,
+                              'input_tokens': comparison_overhead + longest + tokens,
+                              'output_tokens': COMPARISON_MAX_TOKENS})
+
+        grid = {'prompts': len(self.system_prompts), 'test_cases': len(self.dataset['test_cases']),
+                'samples': self.samples,
+                'evaluated_cells': sum(map(len, grid_prompts)) * self.samples if self.halving else None,
+                'original_test_cases': self.dataset.get('dedup', {}).get('original_count')}
+        return build_plan(grid, calls, MODEL_PRICING, concurrency, ESTIMATED_CALL_LATENCY)
 
 
     def load_judge_prompt(self):
@@ -61,10 +286,15 @@ class LLMJudgeEval:
         return system_prompts
 
     def load_dataset(self):
-        """Load test dataset from JSON file"""
+        """Load test dataset from JSON file, collapsing near-duplicate test cases"""
         dataset_path = Path(__file__).parent / "prompt_evaluator" / "datasets" / "movie_preferences.json"
         with open(dataset_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            dataset = json.load(f)
+
+        if not self.dedup:
+            return dataset
+        from utils.dedup import dedup_dataset
+        return dedup_dataset(dataset, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM)
 
     def load_judge_system_prompt(self):
         """Load judge system prompt from file"""
@@ -72,6 +302,18 @@ class LLMJudgeEval:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read().strip()
 
+    def load_pairwise_judge_prompt(self):
+        """Load pairwise judge prompt from file"""
+        prompt_path = Path(__file__).parent / "prompt_evaluator" / "judge_prompts" / "pairwise_judge.txt"
+        with open(prompt_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+
+    def load_pairwise_judge_system_prompt(self):
+        """Load pairwise judge system prompt from file"""
+        prompt_path = Path(__file__).parent / "prompt_evaluator" / "analysis_prompts" / "pairwise_judge_system.txt"
+        with open(prompt_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+
     def load_analysis_prompt_template(self):
         """Load analysis prompt template from file"""
         prompt_path = Path(__file__).parent / "prompt_evaluator" / "analysis_prompts" / "analysis_prompt.txt"
@@ -96,201 +338,575 @@ class LLMJudgeEval:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read().strip()
 
-    def run(self):
-        """Run LLM-as-Judge evaluation"""
+    def run(self, results_path=None):
+        """Run LLM-as-Judge evaluation, streaming every cell to results_path (JSON Lines) if given"""
+        if self.halving:
+            return self.search(results_path)
+
         print("🤖 LLM-AS-JUDGE EVALUATION")
         print("=" * 70)
         print("🎯 Using one model to generate recommendations, another to judge quality")
         print()
+        print_dedup_summary(self.dataset)
 
-        system_prompt_scores = {name: [] for name in self.system_prompts.keys()}
+        import math
+        from utils.results import ResultSink
+        from utils.stats import empty_scores
+
+        names = list(self.system_prompts)
+        test_cases = self.dataset['test_cases']
+        # Judge scores indexed by (system prompt, test case, sample); NaN = not scored
+        scores = empty_scores(len(names), len(test_cases), self.samples)
 
         # Initialize metrics tracking
         prompt_metrics = {}
 
         for system_name, system_prompt in self.system_prompts.items():
             prompt_metrics[system_name] = {
-                'scores': [],
-                'response_times': [],
+                'responses': 0,
                 'prompt_tokens': len(system_prompt.split()) * 1.3,  # Rough token estimation
                 'total_tokens': 0,
                 'total_time': 0.0
             }
 
-        for i, test_case in enumerate(self.dataset['test_cases'], 1):
-            user_input = test_case['user_input']
-            print(f"\n📝 USER INPUT {i}: {user_input}")
-            print("-" * 60)
+        # Cells run concurrently (the limiter decides how many calls are in flight);
+        # results are printed in grid order as they become available. Persona rows are
+        # submitted only GRID_LOOKAHEAD cells per worker ahead of the printed one, so the
+        # pending futures and unread outputs do not grow with the grid
+        max_workers = self.limiter.max_limit if self.limiter else 1
+        window = math.ceil(GRID_LOOKAHEAD * max_workers / (len(names) * self.samples))
+        # Pairwise mode: generations are ranked per persona and sample by a judge
+        # tournament running in its own pool (it waits on the generation futures)
+        tournament = {'outcomes': [], 'rounds': [], 'comparisons': 0, 'first_wins': 0,
+                      'tournaments': 0} if self.pairwise else None
+        with span('grid', prompts=len(names), test_cases=len(test_cases), samples=self.samples), \
+                ThreadPoolExecutor(max_workers=max_workers) as pool, \
+                ThreadPoolExecutor(max_workers=max_workers) as ranker, \
+                ResultSink(results_path, score_key='judge_score',
+                           reservoir_size=EXAMPLE_RESERVOIR_SIZE) as sink:
+            def submit_row(i):
+                test_case = test_cases[i]
+                row = [[pool.submit(self.evaluate_cell, system_prompt, test_case['user_input'],
+                                    system_name, test_case['category'])
+                        for _ in range(self.samples)]
+                       for system_name, system_prompt in self.system_prompts.items()]
+                standings = [
+                    ranker.submit(self.rank_outputs, test_case['user_input'], [futures[k] for futures in row],
+                                  test_case['category'], seed=i * self.samples + k)
+                    for k in range(self.samples)
+                ] if self.pairwise else None
+                return row, standings
+
+            for i, (row, standings) in submit_ahead(range(len(test_cases)), submit_row, window):
+                test_case = test_cases[i]
+                user_input = test_case['user_input']
+                print(f"\n📝 USER INPUT {i + 1}: {user_input}")
+                print("-" * 60)
+
+                if self.pairwise:
+                    row_standings = [future.result() for future in standings]
+                    for standing in row_standings:
+                        tournament['outcomes'].extend(standing['outcomes'])
+                        tournament['rounds'].append(standing['outcomes'])
+                        tournament['comparisons'] += standing['comparisons']
+                        tournament['first_wins'] += standing['first_wins']
+                        tournament['tournaments'] += 1
+
+                for p, (system_name, futures) in enumerate(zip(names, row)):
+                    for k, future in enumerate(futures):
+                        sample_label = f" (sample {k + 1}/{self.samples})" if self.samples > 1 else ""
+                        print(f"\n🔄 System prompt: {system_name.upper()}{sample_label}")
+                        futures[k] = None  # Release the finished cell
+                        try:
+                            cell = future.result()
+                        except Exception as e:
+                            # Retries are exhausted: leave the cell unscored instead of failing the run
+                            print(f"  ❌ Generation failed: {e}")
+                            continue
+                        if self.pairwise:
+                            standing = row_standings[k]
+                            position = standing['ranking'].index(p) + 1
+                            cell['judge_score'] = float(standing['scores'][p])
+                            cell['judge_reasoning'] = (f"Ranked {position} of {len(standing['ranking'])} in the "
+                                                       f"pairwise tournament ({standing['comparisons']} comparisons)")
+
+                        # Track metrics
+                        prompt_metrics[system_name]['responses'] += 1
+                        prompt_metrics[system_name]['total_time'] += cell['response_time']
+                        prompt_metrics[system_name]['total_tokens'] += cell['total_tokens']
+
+                        print(f"  📄 Generated response: {cell['model_output']}")
+                        print(f"  ⏱️  Response time: {cell['response_time']:.2f}s")
+                        if cell['judge_score'] is None:
+                            # The judge failed: leave the cell unscored (NaN) like a failed generation
+                            print("  ❌ Not scored (judge failed)")
+                        else:
+                            print(f"  🤖 Judge evaluation: {cell['judge_score']:.2f}")
+                            scores[p, i, k] = cell['judge_score']
+                        print(f"  📝 Detailed reasoning: {cell['judge_reasoning']}")
+                        print("-" * 80)
+
+                        sink.add(system_name, {
+                            'category': test_case['category'],
+                            'sample': k,
+                            'user_input': user_input,
+                            'raw_output': cell['model_output'],
+                            'response_time': cell['response_time'],
+                            'total_tokens': cell['total_tokens'],
+                            'judge_score': cell['judge_score'],
+                            'judge_reasoning': cell['judge_reasoning'],
+                            'gated': cell['gated'],
+                        })
+
+        if self.hedge_policy:
+            print_hedge_report(self.hedge_policy.report())
+        if self.resilience:
+            print_retry_report(self.resilience.report())
+        if self.structured:
+            print_validity_report(self.structured.report(), self.structured.mode())
+        if self.gate:
+            print_gate_report(self._gate_stats)
 
-            for system_name, system_prompt in self.system_prompts.items():
-                # Add configurable delay between requests to avoid rate limits
-                import time
-                time.sleep(REQUEST_DELAY)
-                print(f"\n🔄 System prompt: {system_name.upper()}")
-
-                # Generate response using OpenAI API directly (like in PromptEval)
-                from openai import OpenAI
-                import time
-                client = OpenAI()
-
-                # Measure response time
-                start_time = time.time()
-
-                response = client.chat.completions.create(
-                    model=GENERATION_MODEL,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_input},
-                    ],
-                    temperature=0.7,
-                    max_tokens=500,
-                )
+        # Show final results and get winner information
+        with span('report'):
+            result = self.show_final_results(scores, prompt_metrics, tournament)
 
-                end_time = time.time()
-                response_time = end_time - start_time
-                model_output = response.choices[0].message.content
+        # If show_final_results returned early (no valid results), return a default result
+        if result is None:
+            return {"best_system": None, "best_score": 0.0,
+                    "avg_response_time": 0.0, "prompt_tokens": 0}
 
-                # Track metrics
-                prompt_metrics[system_name]['response_times'].append(response_time)
-                prompt_metrics[system_name]['total_time'] += response_time
-                if hasattr(response, 'usage') and response.usage:
-                    prompt_metrics[system_name]['total_tokens'] += response.usage.total_tokens
+        # Return the winner information from show_final_results
+        return result
 
-                # Judge the response using the judge model
-                judge_score, judge_reasoning = self.evaluate_with_judge(user_input, model_output)
+    def search(self, results_path=None, eta=HALVING_ETA, min_personas=HALVING_MIN_PERSONAS):
+        """Successive-halving search over the system prompts.
+
+        Every prompt is evaluated on a small, category-balanced persona subset; the best
+        1/eta are kept and re-evaluated on a subset eta times larger (earlier scores are
+        reused) until the survivors have seen every persona. Only those finalists are
+        reported in the results table.
+        """
+        import math
+        import numpy as np
+        from utils.results import ResultSink
+        from utils.search import print_halving_report, stratified_order, subset_size
+        from utils.stats import empty_scores
+
+        print("🤖 LLM-AS-JUDGE EVALUATION (SUCCESSIVE HALVING SEARCH)")
+        print("=" * 70)
+        print(f"🎯 Each round keeps the best 1/{eta} of the system prompts and re-evaluates them on more personas")
+        print()
+        print_dedup_summary(self.dataset)
 
-                print(f"  📄 Generated response: {model_output}")
-                print(f"  ⏱️  Response time: {response_time:.2f}s")
-                print(f"  🤖 Judge evaluation: {judge_score:.2f}")
-                print(f"  📝 Detailed reasoning: {judge_reasoning}")
-                print("-" * 80)
+        names = list(self.system_prompts)
+        test_cases = self.dataset['test_cases']
+        order = stratified_order([tc['category'] for tc in test_cases])
+        weights = np.array([tc.get('cluster_size', 1) for tc in test_cases], dtype=float)
+        # Judge scores indexed by (system prompt, test case, sample); NaN = not evaluated
+        scores = empty_scores(len(names), len(test_cases), self.samples)
 
-                prompt_metrics[system_name]['scores'].append(judge_score)
+        prompt_metrics = {}
+        for system_name, system_prompt in self.system_prompts.items():
+            prompt_metrics[system_name] = {
+                'responses': 0,
+                'prompt_tokens': len(system_prompt.split()) * 1.3,  # Rough token estimation
+                'total_tokens': 0,
+                'total_time': 0.0
+            }
 
-        # Show final results and get winner information
-        result = self.show_final_results(system_prompt_scores, prompt_metrics)
+        def avg_time(p):
+            metrics = prompt_metrics[names[p]]
+            return metrics['total_time'] / metrics['responses'] if metrics['responses'] else 0
+
+        survivors = list(range(len(names)))
+        evaluated = 0  # leading personas of `order` every survivor has been scored on
+        rounds = []
+        max_workers = self.limiter.max_limit if self.limiter else 1
+        with span('grid', prompts=len(names), test_cases=len(test_cases), samples=self.samples), \
+                ThreadPoolExecutor(max_workers=max_workers) as pool, \
+                ResultSink(results_path, score_key='judge_score',
+                           reservoir_size=EXAMPLE_RESERVOIR_SIZE) as sink:
+            while True:
+                number = len(rounds) + 1
+                items = subset_size(len(rounds), len(test_cases), len(survivors), eta, min_personas)
+                print(f"\n🔁 ROUND {number}: {len(survivors)} system prompts × {items} test cases")
+                print("-" * 60)
+
+                with span('round', number=number, prompts=len(survivors), personas=items):
+                    def submit_cell(key):
+                        p, t, _ = key
+                        return pool.submit(self.evaluate_cell, self.system_prompts[names[p]],
+                                           test_cases[t]['user_input'], names[p], test_cases[t]['category'])
+
+                    # Cells are submitted at most GRID_LOOKAHEAD per worker ahead of the printed one
+                    keys = ((p, t, k) for t in order[evaluated:items] for p in survivors for k in range(self.samples))
+                    new_cells = (items - evaluated) * len(survivors) * self.samples
+                    for (p, t, k), future in submit_ahead(keys, submit_cell, GRID_LOOKAHEAD * max_workers):
+                        try:
+                            cell = future.result()
+                        except Exception as e:
+                            print(f"   {names[p]:<12} {test_cases[t]['category']:<20} ❌ generation failed: {e}")
+                            continue
+
+                        metrics = prompt_metrics[names[p]]
+                        metrics['responses'] += 1
+                        metrics['total_time'] += cell['response_time']
+                        metrics['total_tokens'] += cell['total_tokens']
+
+                        if cell['judge_score'] is not None:
+                            scores[p, t, k] = cell['judge_score']
+                        sink.add(names[p], {
+                            'category': test_cases[t]['category'],
+                            'sample': k,
+                            'round': number,
+                            'user_input': test_cases[t]['user_input'],
+                            'raw_output': cell['model_output'],
+                            'response_time': cell['response_time'],
+                            'total_tokens': cell['total_tokens'],
+                            'judge_score': cell['judge_score'],
+                            'judge_reasoning': cell['judge_reasoning'],
+                            'gated': cell['gated'],
+                        })
+                        outcome = ("❌ not scored (judge failed)" if cell['judge_score'] is None
+                                   else f"score {cell['judge_score']:.2f}")
+                        print(f"   {names[p]:<12} {test_cases[t]['category']:<20} "
+                              f"{outcome}  ({cell['response_time']:.2f}s)")
+
+                # Rank the survivors on everything they have seen so far
+                subset = order[:items]
+                cell_weights = np.repeat(weights[subset], self.samples)
+                means = {}
+                for p in survivors:
+                    values = scores[p, subset, :].ravel()
+                    mask = ~np.isnan(values)
+                    means[p] = float((values[mask] * cell_weights[mask]).sum() / cell_weights[mask].sum()) \
+                        if mask.any() else 0.0
+
+                done = items >= len(test_cases)
+                ranked = sorted(survivors, key=lambda p: (means[p], -avg_time(p)), reverse=True)
+                kept = ranked if done else ranked[:max(1, math.ceil(len(ranked) / eta))]
+                rounds.append({
+                    'candidates': [names[p] for p in ranked],
+                    'items': items,
+                    'cells': new_cells,
+                    'means': {names[p]: means[p] for p in ranked},
+                    'kept': [names[p] for p in kept],
+                })
+                evaluated = items
+                survivors = sorted(kept)
+                if done:
+                    break
+
+        if self.hedge_policy:
+            print_hedge_report(self.hedge_policy.report())
+        if self.resilience:
+            print_retry_report(self.resilience.report())
+        if self.structured:
+            print_validity_report(self.structured.report(), self.structured.mode())
+        if self.gate:
+            print_gate_report(self._gate_stats)
+
+        with span('report'):
+            print_halving_report(rounds, sum(r['cells'] for r in rounds),
+                                 len(names) * len(test_cases) * self.samples)
+            result = self.show_final_results(scores[survivors], prompt_metrics,
+                                             names=[names[p] for p in survivors])
 
-        # If show_final_results returned early (no valid results), return a default result
         if result is None:
             return {"best_system": None, "best_score": 0.0,
                     "avg_response_time": 0.0, "prompt_tokens": 0}
-
-        # Return the winner information from show_final_results
         return result
 
-    def evaluate_with_judge(self, user_input, model_output):
-        """Use LLM as judge to evaluate the generated response with rate limit handling"""
+    def evaluate_cell(self, system_prompt, user_input, system_name=None, category=None):
+        """Generate a response for one (system prompt, user input) cell and judge it"""
+        import time
+        from openai import OpenAI
+
+        # Add configurable delay between requests to avoid rate limits
+        time.sleep(REQUEST_DELAY)
+
+        # Generate response using OpenAI API directly (like in PromptEval)
+        client = OpenAI(max_retries=0)  # _call retries; the client must not retry on its own
+
+        # Measure response time
+        start_time = time.time()
+
+        def create(messages, **kwargs):
+            return self._call("generation", lambda: client.chat.completions.create(
+                model=GENERATION_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=GENERATION_MAX_TOKENS,
+                **kwargs,
+            ), prompt=system_name, category=category)
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input},
+        ]
+        if self.structured is None:
+            response = create(messages)
+        else:
+            response = self.structured.generate(create, GENERATION_MODEL, messages, system_name)
+
+        end_time = time.time()
+        model_output = response.choices[0].message.content
+
+        # Judge the response using the judge model (pairwise mode ranks it later instead)
+        judge_score, judge_reasoning = None, None
+        failed_checks = self.check_gate(user_input, model_output, system_name) if self.gate else None
+        if failed_checks:
+            judge_score = GATE_FLOOR_SCORE
+            judge_reasoning = f"Gated without a judge call: {', '.join(failed_checks)}"
+        elif not self.pairwise:
+            judge_score, judge_reasoning = self.evaluate_with_judge(user_input, model_output,
+                                                                    prompt=system_name, category=category)
+
+        return {
+            'model_output': model_output,
+            'response_time': end_time - start_time,
+            'total_tokens': response.usage.total_tokens if getattr(response, 'usage', None) else 0,
+            'judge_score': judge_score,
+            'judge_reasoning': judge_reasoning,
+            'gated': bool(failed_checks),
+        }
+
+    def check_gate(self, user_input, model_output, system_name=None):
+        """Run PromptEval's structural heuristics on an output before it is judged.
+        Returns the failed checks (empty when the output may go to the judge)."""
+        evaluation = self.heuristics.evaluate_response(model_output, "", user_input)
+        failed = [label for key, label in (('is_valid_json', 'invalid JSON'),
+                                           ('has_expected_items', 'fewer than 3 items'),
+                                           ('has_required_fields', 'missing required fields'))
+                  if not evaluation[key]]
+        with self._gate_lock:
+            stats = self._gate_stats.setdefault(system_name, {'checked': 0, 'skipped': 0})
+            stats['checked'] += 1
+            stats['skipped'] += bool(failed)
+        return failed
+
+    def _call(self, stage, fn, **attrs):
+        """Run an API call for the given stage inside the shared concurrency window,
+        hedged when a policy is configured and retried on transient failures.
+        `attrs` are recorded on the call's trace span."""
+        hedged = (lambda: self.hedge_policy.call(stage, fn)) if self.hedge_policy is not None else fn
+        # The slot is taken before hedging starts its clock, so waiting for a slot never
+        # counts as a slow call (a duplicate shares its primary's slot)
+        limited = (lambda: self.limiter.run(stage, hedged)) if self.limiter is not None else hedged
+        with span(stage, 'api', **attrs) as span_attrs:
+            if self.resilience is None:
+                return limited()
+            # Retries wait outside the concurrency window, so backing off frees the slot
+            return self.resilience.call(stage, limited, span_attrs)
+
+    def evaluate_with_judge(self, user_input, model_output, **attrs):
+        """Use LLM as judge to evaluate the generated response (transient failures are retried by _call).
+
+        Returns (score, reasoning); the score is None when the judge failed, so the cell
+        stays unscored instead of getting a made-up score.
+        """
         judge_prompt = self.judge_prompt.format(user_input=user_input, model_output=model_output)
 
-        import time
         import re
-        from openai import OpenAI, RateLimitError
+        from openai import OpenAI
 
-        max_retries = MAX_RETRIES
-        base_delay = 1  # seconds
+        try:
+            client = OpenAI(max_retries=0)
 
-        for attempt in range(max_retries):
+            judge_response = self._call("judge", lambda: client.chat.completions.create(
+                model=JUDGE_MODEL,
+                messages=[
+                    {"role": "system", "content": self.judge_system_prompt},
+                    {"role": "user", "content": judge_prompt}
+                ],
+                temperature=0.0,  # Zero temperature for maximum consistency in judging
+                max_tokens=JUDGE_MAX_TOKENS,   # Need more tokens for detailed reasoning
+            ), **attrs)
+        except Exception as e:
+            if is_quota_error(e):
+                print(f"  ❌ Quota exceeded. Please upgrade your OpenAI plan at https://platform.openai.com/account/billing")
+                return None, f"OpenAI quota exceeded: {str(e)}"
+            if is_rate_limit_error(e):
+                print(f"  ❌ Rate limit persisted after retries: {e}")
+                return None, f"Rate limit exceeded after retries: {str(e)}"
+            print(f"  ⚠️ Judge evaluation failed: {e}")
+            return None, f"Evaluation error: {str(e)}"
+
+        judge_text = judge_response.choices[0].message.content.strip()
+
+        # Extract score and reasoning from response
+        # Look for "Score: X.XX" pattern first
+        score_pattern = r'Score:\s*(\d+\.?\d*)'
+        score_match = re.search(score_pattern, judge_text, re.IGNORECASE)
+
+        if score_match:
+            score = float(score_match.group(1))
+            score = max(0.0, min(1.0, score))  # Clamp to 0-1 range
+
+            # Extract reasoning (everything after "Score: X.XX")
+            score_end_pos = judge_text.find(score_match.group(0)) + len(score_match.group(0))
+            reasoning = judge_text[score_end_pos:].strip()
+            if reasoning.startswith('.') or reasoning.startswith(',') or reasoning.startswith(':'):
+                reasoning = reasoning[1:].strip()
+
+            return score, reasoning if reasoning else "No detailed reasoning provided"
+
+        # Fallback: look for any number if "Score:" pattern not found
+        score_match = re.search(r'(\d+\.?\d*)', judge_text)
+        if score_match:
+            score = float(score_match.group(1))
+            score = max(0.0, min(1.0, score))
+            reasoning = "Score extracted but no detailed reasoning provided in expected format"
+            return score, reasoning
+
+        print(f"  ⚠️ Could not parse judge score: {judge_text}")
+        return None, "Failed to parse score from judge response"
+
+    def rank_outputs(self, user_input, futures, category=None, seed=0):
+        """Rank one persona's generated outputs (one future per system prompt, in prompt order)
+        with a merge-sort tournament of pairwise judge calls.
+
+        The two outputs of every comparison are shown in random order to cancel position
+        bias. Returns the best-first ranking of prompt indices, their rank scores and the
+        decisive (winner, loser) outcomes.
+        """
+        import random
+        from utils.ranking import merge_sort, rank_scores
+
+        names = list(self.system_prompts)
+        outputs = []
+        for future in futures:
             try:
-                client = OpenAI()
-
-                judge_response = client.chat.completions.create(
-                    model=JUDGE_MODEL,
-                    messages=[
-                        {"role": "system", "content": self.judge_system_prompt},
-                        {"role": "user", "content": judge_prompt}
-                    ],
-                    temperature=0.0,  # Zero temperature for maximum consistency in judging
-                    max_tokens=500,   # Need more tokens for detailed reasoning
-                )
-                judge_text = judge_response.choices[0].message.content.strip()
+                outputs.append(future.result()['model_output'])
+            except Exception:
+                outputs.append(None)  # Failed generations are left out of the tournament
+        rng = random.Random(seed)
+        outcomes = []
+        first_wins = 0
+        comparisons = 0
+
+        def better(a, b):
+            nonlocal first_wins, comparisons
+            first, second = (b, a) if rng.random() < 0.5 else (a, b)
+            comparisons += 1
+            verdict = self.judge_pair(user_input, outputs[first], outputs[second],
+                                      prompts=f"{names[first]} vs {names[second]}", category=category)
+            if verdict is None:
+                # No usable verdict: break the tie at random and record no outcome
+                return rng.random() < 0.5
+            winner, loser = (first, second) if verdict == 'A' else (second, first)
+            first_wins += verdict == 'A'
+            outcomes.append((winner, loser))
+            return winner == a
+
+        ranking = merge_sort([i for i, output in enumerate(outputs) if output is not None], better)
+        return {
+            'ranking': ranking,
+            'scores': rank_scores(ranking, len(outputs)),
+            'outcomes': outcomes,
+            'comparisons': comparisons,
+            'first_wins': first_wins,
+        }
+
+    def judge_pair(self, user_input, response_a, response_b, **attrs):
+        """Ask the judge which of two responses is better: 'A', 'B' or None if it failed"""
+        import re
+        from openai import OpenAI
+
+        pairwise_prompt = self.pairwise_judge_prompt.format(
+            user_input=user_input, response_a=response_a, response_b=response_b)
+
+        try:
+            client = OpenAI(max_retries=0)
+            response = self._call("pairwise", lambda: client.chat.completions.create(
+                model=JUDGE_MODEL,
+                messages=[
+                    {"role": "system", "content": self.pairwise_judge_system_prompt},
+                    {"role": "user", "content": pairwise_prompt}
+                ],
+                temperature=0.0,
+                max_tokens=PAIRWISE_MAX_TOKENS,
+            ), **attrs)
+            verdict_text = response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"  ⚠️ Pairwise judge failed: {e}")
+            return None
 
-                # Extract score and reasoning from response
-                # Look for "Score: X.XX" pattern first
-                score_pattern = r'Score:\s*(\d+\.?\d*)'
-                score_match = re.search(score_pattern, judge_text, re.IGNORECASE)
+        match = re.search(r'Winner:\s*([AB])\b', verdict_text, re.IGNORECASE) or re.search(r'\b([AB])\b', verdict_text)
+        if not match:
+            print(f"  ⚠️ Could not parse pairwise verdict: {verdict_text}")
+            return None
+        return match.group(1).upper()
 
-                if score_match:
-                    score = float(score_match.group(1))
-                    score = max(0.0, min(1.0, score))  # Clamp to 0-1 range
+    def show_final_results(self, scores, prompt_metrics, tournament=None, names=None):
+        """Show final comparison results with comprehensive analysis including performance metrics.
 
-                    # Extract reasoning (everything after "Score: X.XX")
-                    score_end_pos = judge_text.find(score_match.group(0)) + len(score_match.group(0))
-                    reasoning = judge_text[score_end_pos:].strip()
-                    if reasoning.startswith('.') or reasoning.startswith(',') or reasoning.startswith(':'):
-                        reasoning = reasoning[1:].strip()
+        `scores` is the (system prompt × test case × sample) array of judge scores for
+        `names` (default: every system prompt). In pairwise mode they are tournament rank
+        scores and `tournament` holds the judge outcomes, from which Bradley-Terry and Elo
+        ratings are fitted.
+        """
+        import math
+        import numpy as np
+        from utils.stats import print_category_breakdown, print_significance, summarize
 
-                    return score, reasoning if reasoning else "No detailed reasoning provided"
-                else:
-                    # Fallback: look for any number if "Score:" pattern not found
-                    score_match = re.search(r'(\d+\.?\d*)', judge_text)
-                    if score_match:
-                        score = float(score_match.group(1))
-                        score = max(0.0, min(1.0, score))
-                        reasoning = "Score extracted but no detailed reasoning provided in expected format"
-                        return score, reasoning
-                    else:
-                        print(f"  ⚠️ Could not parse judge score: {judge_text}")
-                        return 0.5, "Failed to parse score from judge response"
-
-            except RateLimitError as e:
-                if "insufficient_quota" in str(e).lower():
-                    print(f"  ❌ Quota exceeded. Please upgrade your OpenAI plan at https://platform.openai.com/account/billing")
-                    return 0.3, f"OpenAI quota exceeded: {str(e)}"
-
-                # Extract wait time from error message if available
-                wait_time = 20  # default
-                if "try again in" in str(e).lower():
-                    import re
-                    time_match = re.search(r'try again in (\d+)', str(e).lower())
-                    if time_match:
-                        wait_time = int(time_match.group(1))
-
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt) + wait_time  # exponential backoff + suggested wait
-                    print(f"  ⏳ Rate limit hit (attempt {attempt + 1}/{max_retries}). Waiting {delay}s...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    print(f"  ❌ Max retries exceeded for rate limit: {e}")
-                    return 0.4, f"Rate limit exceeded after {max_retries} attempts: {str(e)}"
-
-            except Exception as e:
-                error_msg = str(e)
-                if "connection" in error_msg.lower() or "timeout" in error_msg.lower():
-                    if attempt < max_retries - 1:
-                        delay = base_delay * (2 ** attempt)
-                        print(f"  🔄 Connection error (attempt {attempt + 1}/{max_retries}). Retrying in {delay}s...")
-                        time.sleep(delay)
-                        continue
-
-                print(f"  ⚠️ Judge evaluation failed: {e}")
-                return 0.5, f"Evaluation error: {error_msg}"
-
-    def show_final_results(self, system_prompt_scores, prompt_metrics):
-        """Show final comparison results with comprehensive analysis including performance metrics"""
         print("\n" + "=" * 120)
         print("🏆 COMPREHENSIVE EVALUATION RESULTS - LLM-AS-JUDGE ANALYSIS WITH PERFORMANCE METRICS")
         print("=" * 120)
 
         # Load test cases info
         test_cases = self.dataset['test_cases']
+        names = list(names if names is not None else self.system_prompts)
+
+        def avg_time(system_name):
+            metrics = prompt_metrics[system_name]
+            return metrics['total_time'] / metrics['responses'] if metrics['responses'] else 0
+
+        # In pairwise mode the Bradley-Terry ratings fitted to every judge outcome rank the prompts
+        leader = None
+        if tournament is not None:
+            from utils.ranking import bradley_terry, elo
+            bt_ratings = bradley_terry(tournament['outcomes'], len(names))
+            elo_ratings = elo(tournament['outcomes'], len(names))
+            rated = [i for i in range(len(names)) if not np.isnan(scores[i]).all()]
+            leader = max(rated, key=lambda i: bt_ratings[i]) if rated else None
+
+        # Winner: highest average score (highest rating in pairwise mode); ties go to the
+        # faster, then the shorter prompt.
+        # It only counts as a real winner if it beats every other prompt significantly
+        # (on the scores, or on the ratings in pairwise mode).
+        summary = summarize(
+            scores, names,
+            categories=[tc['category'] for tc in test_cases],
+            weights=[tc.get('cluster_size', 1) for tc in test_cases],
+            n_boot=BOOTSTRAP_RESAMPLES, confidence=CONFIDENCE_LEVEL, alpha=SIGNIFICANCE_LEVEL,
+            rank_key=lambda i, mean: (-avg_time(names[i]), -prompt_metrics[names[i]]['prompt_tokens']),
+            leader=leader
+        )
+        if tournament is not None and leader is not None:
+            from utils.ranking import rating_tests
+            summary['tests'] = rating_tests(tournament['rounds'], names, leader, candidates=rated,
+                                            n_boot=BOOTSTRAP_RESAMPLES, alpha=SIGNIFICANCE_LEVEL)
+            summary['significant'] = bool(summary['tests']) and all(t['better'] for t in summary['tests'])
 
         # Calculate comprehensive stats including performance metrics
         prompt_stats = {}
-        for system_name, scores in system_prompt_scores.items():
+        for i, system_name in enumerate(names):
             # Skip system prompts with no scores to avoid division by zero
-            if not scores:
+            if not summary['count'][i]:
                 print(f"⚠️ Skipping {system_name} - no evaluation scores collected")
                 continue
 
-            avg_score = sum(scores) / len(scores)
+            avg_score = float(summary['mean'][i])
             metrics = prompt_metrics[system_name]
-            avg_response_time = sum(metrics['response_times']) / len(metrics['response_times']) if metrics['response_times'] else 0
+            avg_response_time = avg_time(system_name)
             efficiency_score = avg_score / (1 + avg_response_time + metrics['prompt_tokens']/1000)  # Combined score
 
             prompt_stats[system_name] = {
                 'avg_score': avg_score,
-                'scores': scores,
+                'ci': (float(summary['ci_low'][i]), float(summary['ci_high'][i])),
+                'scores': [s for s in scores[i].ravel().tolist() if not math.isnan(s)],
                 'avg_response_time': avg_response_time,
                 'prompt_tokens': metrics['prompt_tokens'],
                 'total_tokens': metrics['total_tokens'],
@@ -298,21 +914,21 @@ class LLMJudgeEval:
                 'prompt_text': self.system_prompts[system_name]
             }
 
+        if tournament is not None:
+            for i, system_name in enumerate(names):
+                if system_name in prompt_stats:
+                    prompt_stats[system_name]['bt_rating'] = float(bt_ratings[i])
+                    prompt_stats[system_name]['elo_rating'] = float(elo_ratings[i])
+                    prompt_stats[system_name]['wins'] = sum(1 for w, _ in tournament['outcomes'] if w == i)
+                    prompt_stats[system_name]['losses'] = sum(1 for _, l in tournament['outcomes'] if l == i)
+
         # Check if we have any valid results to analyze
         if not prompt_stats:
             print("\n❌ ERROR: No system prompts had successful evaluations. Cannot determine winner.")
             print("This might be due to API errors, rate limiting, or other issues during evaluation.")
             return None
 
-        # Determine winner considering both quality and efficiency
-        # First priority: highest average score
-        # Second priority: lowest response time (when scores are close)
-        # Third priority: lowest prompt token count (when scores and times are close)
-        winner = max(prompt_stats.keys(), key=lambda x: (
-            prompt_stats[x]['avg_score'],  # Primary: quality score
-            -prompt_stats[x]['avg_response_time'],  # Secondary: speed (negative for maximization)
-            -prompt_stats[x]['prompt_tokens']  # Tertiary: token efficiency (negative for maximization)
-        ))
+        winner = names[summary['winner']]
         winner_stats = prompt_stats[winner]
 
         # Header
@@ -320,52 +936,75 @@ class LLMJudgeEval:
         for i, tc in enumerate(test_cases, 1):
             print(f"   {i}. {tc['category'].replace('_', ' ').title()}: \"{tc['user_input']}\"")
 
-        print(f"\n🏆 WINNER: {winner.upper()} (Score: {winner_stats['avg_score']:.3f}, Time: {winner_stats['avg_response_time']:.2f}s, Tokens: {winner_stats['prompt_tokens']:.0f})")
+        title = "WINNER" if summary['significant'] else "LEADER (no statistically significant winner)"
+        print(f"\n🏆 {title}: {winner.upper()} (Score: {winner_stats['avg_score']:.3f}, Time: {winner_stats['avg_response_time']:.2f}s, Tokens: {winner_stats['prompt_tokens']:.0f})")
 
         # Detailed results table with performance metrics
         print(f"\n{'─' * 140}")
         print("📊 COMPREHENSIVE RESULTS BY SYSTEM PROMPT")
         print(f"{'─' * 140}")
-        header = "<12"
-        print(f"{'Prompt':<12} {'Avg Score':<10} {'Avg Time':<9} {'PromptTok':<10} {'Efficiency':<11} {'Individual Scores':<25}")
+        ci_label = f"{CONFIDENCE_LEVEL:.0%} CI"
+        print(f"{'Prompt':<12} {'Avg Score':<10} {ci_label:<14} {'Avg Time':<9} {'PromptTok':<10} {'Efficiency':<11} {'Individual Scores':<25}")
         print(f"{'─' * 140}")
 
-        for system_name in sorted(prompt_stats.keys(), key=lambda x: prompt_stats[x]['avg_score'], reverse=True):
+        rank_by = 'bt_rating' if tournament is not None else 'avg_score'
+        ranking = sorted(prompt_stats.keys(), key=lambda x: prompt_stats[x][rank_by], reverse=True)
+        for system_name in ranking:
             stats = prompt_stats[system_name]
-            scores_str = ', '.join([f'{s:.2f}' for s in stats['scores']])
+            scores_str = ', '.join([f'{s:.2f}' for s in stats['scores'][:MAX_INDIVIDUAL_SCORES]])
+            if len(stats['scores']) > MAX_INDIVIDUAL_SCORES:
+                scores_str += f", … ({len(stats['scores'])} total)"
+            ci_str = f"{stats['ci'][0]:.3f}-{stats['ci'][1]:.3f}"
             marker = "🏆" if system_name == winner else "  "
-            print(f"{marker} {system_name:<10} {stats['avg_score']:<10.3f} {stats['avg_response_time']:<9.2f} {stats['prompt_tokens']:<10.0f} {stats['efficiency_score']:<11.3f} {scores_str:<25}")
+            print(f"{marker} {system_name:<10} {stats['avg_score']:<10.3f} {ci_str:<14} {stats['avg_response_time']:<9.2f} {stats['prompt_tokens']:<10.0f} {stats['efficiency_score']:<11.3f} {scores_str:<25}")
 
         print(f"{'─' * 140}")
+        if tournament is not None:
+            print("   Scores are tournament rank scores per persona (1.0 = ranked first, 0.0 = ranked last)")
+            self.show_ratings(ranking, prompt_stats, tournament)
+
+        # Statistical significance of the leader against every other prompt
+        if summary['tests'] and tournament is not None:
+            print(f"\n📐 SIGNIFICANCE (Bradley-Terry rating, bootstrap over tournaments, α={SIGNIFICANCE_LEVEL}):")
+            print_significance(summary, diff_format='+.0f')
+        elif summary['tests']:
+            print(f"\n📐 SIGNIFICANCE (paired permutation test, α={SIGNIFICANCE_LEVEL}):")
+            print_significance(summary)
+
+        print("\n🎭 AVERAGE SCORE BY PERSONA CATEGORY:")
+        print_category_breakdown(summary, order=[names.index(name) for name in ranking])
 
         # Performance insights
         print("\n💡 PERFORMANCE INSIGHTS:")
         print(f"   • Fastest response: {min(prompt_stats.keys(), key=lambda x: prompt_stats[x]['avg_response_time']).upper()} ({min([stats['avg_response_time'] for stats in prompt_stats.values()]):.2f}s)")
         print(f"   • Most token-efficient: {min(prompt_stats.keys(), key=lambda x: prompt_stats[x]['prompt_tokens']).upper()} ({min([stats['prompt_tokens'] for stats in prompt_stats.values()]):.0f} tokens)")
         print(f"   • Highest efficiency score: {max(prompt_stats.keys(), key=lambda x: prompt_stats[x]['efficiency_score']).upper()} ({max([stats['efficiency_score'] for stats in prompt_stats.values()]):.3f})")
+        if self.limiter:
+            print(f"   • Adaptive concurrency: {format_window(self.limiter.snapshot())}")
 
         # LLM Analysis of winner prompt
-        print(f"\n🤖 LLM ANALYSIS OF WINNING PROMPT: {winner.upper()}")
-        print(f"{'─' * 60}")
-
-        winner_analysis = self.analyze_prompt_with_llm(winner, winner_stats['prompt_text'])
-        print(winner_analysis)
-
-        # Compare with other prompts
-        print(f"\n⚖️  COMPARISON WITH OTHER PROMPTS:")
-        print(f"{'─' * 60}")
-
-        for system_name in sorted(prompt_stats.keys()):
-            if system_name != winner:
-                stats = prompt_stats[system_name]
-                comparison = self.compare_prompts_with_llm(
-                    winner, winner_stats['prompt_text'],
-                    system_name, stats['prompt_text'],
-                    winner_stats['avg_score'], stats['avg_score']
-                )
-                print(f"\n🎯 {winner.upper()} vs {system_name.upper()}:")
-                print(f"   Score difference: {winner_stats['avg_score'] - stats['avg_score']:+.3f}")
-                print(f"   {comparison}")
+        with span('analysis_tail', comparisons=len(prompt_stats) - 1):
+            print(f"\n🤖 LLM ANALYSIS OF WINNING PROMPT: {winner.upper()}")
+            print(f"{'─' * 60}")
+
+            winner_analysis = self.analyze_prompt_with_llm(winner, winner_stats['prompt_text'])
+            print(winner_analysis)
+
+            # Compare with other prompts
+            print(f"\n⚖️  COMPARISON WITH OTHER PROMPTS:")
+            print(f"{'─' * 60}")
+
+            for system_name in sorted(prompt_stats.keys()):
+                if system_name != winner:
+                    stats = prompt_stats[system_name]
+                    comparison = self.compare_prompts_with_llm(
+                        winner, winner_stats['prompt_text'],
+                        system_name, stats['prompt_text'],
+                        winner_stats['avg_score'], stats['avg_score']
+                    )
+                    print(f"\n🎯 {winner.upper()} vs {system_name.upper()}:")
+                    print(f"   Score difference: {winner_stats['avg_score'] - stats['avg_score']:+.3f}")
+                    print(f"   {comparison}")
 
         print(f"\n{'=' * 100}")
         print("✨ EVALUATION COMPLETE - LLM-AS-JUDGE ANALYSIS PROVIDES DEEP INSIGHTS")
@@ -376,26 +1015,46 @@ class LLMJudgeEval:
             "best_system": winner,
             "best_score": winner_stats['avg_score'],
             "avg_response_time": winner_stats['avg_response_time'],
-            "prompt_tokens": winner_stats['prompt_tokens']
+            "prompt_tokens": winner_stats['prompt_tokens'],
+            "concurrency_window": self.limiter.window if self.limiter else 1,
+            "significant": summary['significant']
         }
 
+    def show_ratings(self, ranking, prompt_stats, tournament):
+        """Print Bradley-Terry / Elo ratings fitted from the pairwise tournament outcomes"""
+        n = len(self.system_prompts)
+        all_pairs = tournament['tournaments'] * n * (n - 1) // 2
+        decisive = len(tournament['outcomes'])
+
+        print("\n⚔️  PAIRWISE TOURNAMENT RATINGS (Bradley-Terry, Elo):")
+        print(f"{'Prompt':<12} {'BT Rating':>10} {'Elo':>8} {'Wins':>6} {'Losses':>7}")
+        for system_name in ranking:
+            stats = prompt_stats[system_name]
+            print(f"{system_name:<12} {stats['bt_rating']:>10.0f} {stats['elo_rating']:>8.0f} "
+                  f"{stats['wins']:>6} {stats['losses']:>7}")
+        print(f"   • Judge comparisons: {tournament['comparisons']} over {tournament['tournaments']} tournaments "
+              f"(all-pairs judging would need {all_pairs})")
+        if decisive:
+            print(f"   • Position check: the response shown first won {tournament['first_wins'] / decisive:.0%} "
+                  f"of {decisive} decisive comparisons (order randomized)")
+
     def analyze_prompt_with_llm(self, prompt_name, prompt_text):
         """Use LLM to analyze why a system prompt works well"""
         analysis_prompt = self.analysis_prompt_template.format(prompt_text=prompt_text)
 
         try:
             from openai import OpenAI
-            client = OpenAI()
+            client = OpenAI(max_retries=0)
 
-            response = client.chat.completions.create(
+            response = self._call("analysis", lambda: client.chat.completions.create(
                 model=JUDGE_MODEL,
                 messages=[
                     {"role": "system", "content": self.analysis_system_prompt},
                     {"role": "user", "content": analysis_prompt}
                 ],
                 temperature=0.1,
-                max_tokens=400,
-            )
+                max_tokens=ANALYSIS_MAX_TOKENS,
+            ), prompt=prompt_name)
 
             return response.choices[0].message.content.strip()
 
@@ -405,27 +1064,27 @@ class LLMJudgeEval:
     def compare_prompts_with_llm(self, winner_name, winner_prompt, loser_name, loser_prompt, winner_score, loser_score):
         """Use LLM to compare two system prompts"""
         comparison_prompt = self.comparison_prompt_template.format(
-            winner_name=winner_name,
+            winner_name=winner_name.upper(),
             winner_score=winner_score,
             winner_prompt=winner_prompt,
-            loser_name=loser_name,
+            loser_name=loser_name.upper(),
             loser_score=loser_score,
             loser_prompt=loser_prompt
         )
 
         try:
             from openai import OpenAI
-            client = OpenAI()
+            client = OpenAI(max_retries=0)
 
-            response = client.chat.completions.create(
+            response = self._call("comparison", lambda: client.chat.completions.create(
                 model=JUDGE_MODEL,
                 messages=[
                     {"role": "system", "content": self.comparison_system_prompt},
                     {"role": "user", "content": comparison_prompt}
                 ],
                 temperature=0.1,
-                max_tokens=200,
-            )
+                max_tokens=COMPARISON_MAX_TOKENS,
+            ), prompt=loser_name)
 
             return response.choices[0].message.content.strip()
 
@@ -436,9 +1095,47 @@ class LLMJudgeEval:
 class PromptEval:
     """Custom evaluator using OpenAI API directly"""
 
-    def __init__(self):
-        self.system_prompts = self.load_system_prompts()
-        self.dataset = self.load_dataset()
+    def __init__(self, limiter=None, samples=SAMPLES_PER_CELL, dedup=True, resilience=None, structured=None):
+        # Optional AIMDLimiter shared by every API call
+        self.limiter = limiter
+        # Optional StructuredOutput requesting schema-constrained JSON and counting invalid outputs
+        self.structured = structured
+        # Optional ResilientCaller retrying transient failures of every API call
+        self.resilience = resilience
+        # Number of generations per system prompt and test case
+        self.samples = samples
+        # Collapse near-duplicate test cases when the dataset is loaded
+        self.dedup = dedup
+
+    # Prompt files and the dataset are loaded lazily on first access
+    @cached_property
+    def system_prompts(self):
+        return self.load_system_prompts()
+
+    @cached_property
+    def dataset(self):
+        return self.load_dataset()
+
+    def preload(self):
+        """Load every prompt file and the dataset up front"""
+        for name in ('system_prompts', 'dataset'):
+            getattr(self, name)
+
+    def plan(self, concurrency=MAX_CONCURRENCY):
+        """Estimate calls, tokens, cost and wall time of a run without calling the API"""
+        calls = []
+        for test_case in self.dataset['test_cases']:
+            user_tokens = estimate_tokens(test_case['user_input'])
+            for system_prompt in self.system_prompts.values():
+                for _ in range(self.samples):
+                    calls.append({'stage': 'generation', 'model': GENERATION_MODEL,
+                                  'input_tokens': estimate_tokens(system_prompt) + user_tokens,
+                                  'output_tokens': GENERATION_MAX_TOKENS})
+
+        grid = {'prompts': len(self.system_prompts), 'test_cases': len(self.dataset['test_cases']),
+                'samples': self.samples,
+                'original_test_cases': self.dataset.get('dedup', {}).get('original_count')}
+        return build_plan(grid, calls, MODEL_PRICING, concurrency, ESTIMATED_CALL_LATENCY)
 
     def load_system_prompts(self):
         """Load system prompts from separate files"""
@@ -453,10 +1150,15 @@ class PromptEval:
         return system_prompts
 
     def load_dataset(self):
-        """Load test dataset from JSON file"""
+        """Load test dataset from JSON file, collapsing near-duplicate test cases"""
         dataset_path = Path(__file__).parent / "prompt_evaluator" / "datasets" / "movie_preferences.json"
         with open(dataset_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            dataset = json.load(f)
+
+        if not self.dedup:
+            return dataset
+        from utils.dedup import dedup_dataset
+        return dedup_dataset(dataset, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM)
 
     def eval_sample(self, sample):
         """Evaluate a single sample using evals framework"""
@@ -465,38 +1167,76 @@ class PromptEval:
 
         results = {}
 
-        # Test each system prompt
-        for system_name, system_prompt in self.system_prompts.items():
-            # Use OpenAI client directly instead of evals completion function
-            from openai import OpenAI
-            client = OpenAI()
-
-            # Get response
-            response = client.chat.completions.create(
-                model=GENERATION_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
+        # Test each system prompt, concurrently within the limiter's window
+        max_workers = self.limiter.max_limit if self.limiter else 1
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                system_name: pool.submit(self.generate, system_prompt, user_input, system_name)
+                for system_name, system_prompt in self.system_prompts.items()
+            }
 
-            output = response.choices[0].message.content
+            for system_name, future in futures.items():
+                try:
+                    output = future.result()
+                except Exception as e:
+                    # Retries are exhausted: leave this prompt unscored for the sample
+                    print(f"  ❌ Generation failed: {e}")
+                    results[system_name] = None
+                    continue
 
-            # Evaluate the response
-            evaluation = self.evaluate_response(output, expected, user_input)
-            results[system_name] = evaluation
+                # Evaluate the response
+                evaluation = self.evaluate_response(output, expected, user_input)
+                results[system_name] = evaluation
 
-            # Print response for debugging/verification
-            print(f"  📄 Response: {output}")
-            print(f"  📊 Metrics: JSON={evaluation['is_valid_json']}, Items={evaluation['has_expected_items']}, Fields={evaluation['has_required_fields']}, Score={evaluation['quality_score']:.2f}")
+                # Print response for debugging/verification
+                print(f"  📄 Response: {output}")
+                print(f"  📊 Metrics: JSON={evaluation['is_valid_json']}, Items={evaluation['has_expected_items']}, Fields={evaluation['has_required_fields']}, Score={evaluation['quality_score']:.2f}")
 
         return results
 
+    def generate(self, system_prompt, user_input, system_name=None):
+        """Get a response for one system prompt and user input"""
+        # Use OpenAI client directly instead of evals completion function
+        from openai import OpenAI
+        client = OpenAI(max_retries=0)
+
+        def create(messages, **kwargs):
+            def call():
+                return client.chat.completions.create(
+                    model=GENERATION_MODEL,
+                    messages=messages,
+                    max_tokens=GENERATION_MAX_TOKENS,
+                    temperature=0.7,
+                    **kwargs
+                )
+
+            limited = (lambda: self.limiter.run("generation", call)) if self.limiter else call
+            with span("generation", 'api', prompt=system_name) as span_attrs:
+                if self.resilience is None:
+                    return limited()
+                return self.resilience.call("generation", limited, span_attrs)
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input}
+        ]
+        if self.structured is None:
+            response = create(messages)
+        else:
+            response = self.structured.generate(create, GENERATION_MODEL, messages, system_name)
+        return response.choices[0].message.content
+
+    def _response_items(self, parsed):
+        """The list of items in a parsed response; empty when there is none, e.g. for
+        valid JSON that is not an object"""
+        if not isinstance(parsed, dict):
+            return []
+        items = parsed.get('items', parsed.get('recommendations', parsed.get('results', parsed.get('movies', []))))
+        return items if isinstance(items, list) else []
+
     def _validate_response_structure(self, parsed):
         """Validate the structure of the parsed response"""
-        items = parsed.get('items', parsed.get('recommendations', parsed.get('results', parsed.get('movies', []))))
+        items = self._response_items(parsed)
         if not items:
             return False
 
@@ -509,7 +1249,7 @@ class PromptEval:
 
     def _display_response_items(self, parsed_json):
         """Display the response items in a generic way"""
-        items = parsed_json.get('items', parsed_json.get('recommendations', parsed_json.get('results', parsed_json.get('movies', []))))
+        items = self._response_items(parsed_json)
         if items:
             print("📋 Response items:")
             for k, item in enumerate(items[:3], 1):
@@ -524,17 +1264,11 @@ class PromptEval:
     def evaluate_response(self, output, expected, user_input):
         """Evaluate a single response - same logic as original evaluator"""
         try:
-            # Clean the result
-            cleaned_result = output.strip()
-            if cleaned_result.startswith('```json'):
-                cleaned_result = cleaned_result.replace('```json', '').replace('```', '').strip()
-            elif cleaned_result.startswith('```'):
-                cleaned_result = cleaned_result.replace('```', '').strip()
-
-            parsed = json.loads(cleaned_result)
+            # Markdown fences are only stripped when the output does not parse as is
+            parsed = parse_json_output(output)
             is_valid_json = True
             # Generic evaluation - look for any field containing a list of recommendations
-            items = parsed.get('items', parsed.get('recommendations', parsed.get('results', parsed.get('movies', []))))
+            items = self._response_items(parsed)
             has_expected_items = len(items) >= 3
             has_required_fields = self._validate_response_structure(parsed)
             quality_score = (is_valid_json + has_expected_items + has_required_fields) / 3
@@ -560,67 +1294,113 @@ class PromptEval:
                 'user_input': user_input
             }
 
-    def run(self):
-        """Run the evaluation using evals framework"""
-        all_results = []
-        system_prompt_scores = {name: [] for name in self.system_prompts.keys()}
+    def run(self, results_path=None):
+        """Run the evaluation using evals framework.
+
+        Results are streamed to results_path (JSON Lines) if given; only running
+        aggregates and a few example results per prompt are kept in memory.
+        """
+        from utils.results import ResultSink
+        from utils.stats import empty_scores, summarize
+
+        sink = ResultSink(results_path, reservoir_size=EXAMPLE_RESERVOIR_SIZE)
+        names = list(self.system_prompts)
+        test_cases = self.dataset['test_cases']
+        # Quality scores indexed by (system prompt, test case, sample); NaN = not scored
+        scores = empty_scores(len(names), len(test_cases), self.samples)
 
         print("🎯 PROMPT EVALUATOR (Using OpenAI Evals)")
         print("=" * 70)
         print("🎯 Testing different SYSTEM prompts with evals framework")
-
-        for i, test_case in enumerate(self.dataset['test_cases'], 1):
-            sample = {"input": test_case['user_input'], "ideal": ""}
-
-            print(f"\n📝 USER INPUT {i} ({test_case['category']}): {test_case['user_input']}")
-            print("-" * 50)
-
-            # Evaluate this sample
-            results = self.eval_sample(sample)
-
-            for system_name, result in results.items():
-                print(f"\n🔄 System prompt: {system_name.upper()}")
-                print(f"✅ Valid JSON: {'Yes' if result['is_valid_json'] else 'No'}")
-                print(f"✅ Expected items: {'Yes' if result['has_expected_items'] else 'No'}")
-                print(f"✅ Complete fields: {'Yes' if result['has_required_fields'] else 'No'}")
-                print(f"📊 Score: {result['quality_score']:.2%}")
-
-                if result['parsed_json'] and result['quality_score'] > 0:
-                    self._display_response_items(result['parsed_json'])
-
-                all_results.append(result)
-                system_prompt_scores[system_name].append(result['quality_score'])
+        print_dedup_summary(self.dataset)
+
+        with span('grid', prompts=len(names), test_cases=len(test_cases), samples=self.samples), sink:
+            for i, test_case in enumerate(test_cases):
+                sample = {"input": test_case['user_input'], "ideal": ""}
+
+                print(f"\n📝 USER INPUT {i + 1} ({test_case['category']}): {test_case['user_input']}")
+                print("-" * 50)
+
+                for k in range(self.samples):
+                    # Evaluate this sample
+                    results = self.eval_sample(sample)
+
+                    for p, system_name in enumerate(names):
+                        result = results[system_name]
+                        sample_label = f" (sample {k + 1}/{self.samples})" if self.samples > 1 else ""
+                        print(f"\n🔄 System prompt: {system_name.upper()}{sample_label}")
+                        if result is None:
+                            print("❌ Not scored (generation failed)")
+                            continue
+                        print(f"✅ Valid JSON: {'Yes' if result['is_valid_json'] else 'No'}")
+                        print(f"✅ Expected items: {'Yes' if result['has_expected_items'] else 'No'}")
+                        print(f"✅ Complete fields: {'Yes' if result['has_required_fields'] else 'No'}")
+                        print(f"📊 Score: {result['quality_score']:.2%}")
+
+                        if result['parsed_json'] and result['quality_score'] > 0:
+                            self._display_response_items(result['parsed_json'])
+
+                        sink.add(system_name, dict(result, category=test_case['category'], sample=k))
+                        scores[p, i, k] = result['quality_score']
+
+        if self.resilience:
+            print_retry_report(self.resilience.report())
+        if self.structured:
+            print_validity_report(self.structured.report(), self.structured.mode())
 
         # Final summary
-        self.show_summary(system_prompt_scores)
-        best_system_prompt = self.get_best_prompt(system_prompt_scores)
-        self.show_best_system_prompt(best_system_prompt)
-        self.show_examples(all_results)
+        with span('report'):
+            summary = summarize(scores, names, categories=[tc['category'] for tc in test_cases],
+                                weights=[tc.get('cluster_size', 1) for tc in test_cases],
+                                n_boot=BOOTSTRAP_RESAMPLES, confidence=CONFIDENCE_LEVEL, alpha=SIGNIFICANCE_LEVEL)
+            self.show_summary(summary)
+            best_system_prompt = self.get_best_prompt(summary)
+            self.show_best_system_prompt(best_system_prompt)
+            self.show_examples(sink.examples())
 
         return {"best_system_prompt": best_system_prompt}
 
-    def show_summary(self, system_prompt_scores):
-        """Show final summary"""
+    def show_summary(self, summary):
+        """Show final summary from a utils.stats summary"""
+        from utils.stats import print_category_breakdown
+
         print("\n" + "=" * 60)
         print("📊 FINAL SUMMARY - SYSTEM PROMPT COMPARISON (with evals)")
         print("=" * 60)
 
-        for system_name, scores in system_prompt_scores.items():
-            if scores:
-                avg_score = sum(scores) / len(scores)
-                success_rate = sum(1 for s in scores if s >= 0.99) / len(scores)  # Avoid float equality
+        for i, system_name in enumerate(summary['names']):
+            if summary['count'][i]:
                 print(f"\n🎯 {system_name.upper()}:")
-                print(f"   Average score: {avg_score:.2%}")
-                print(f"   Success rate (≥99%): {success_rate:.2%}")
-                print(f"   Test cases: {len(scores)}")
-
-    def get_best_prompt(self, system_prompt_scores):
-        """Determine best system prompt"""
-        best_system_prompt = max(system_prompt_scores.keys(),
-                         key=lambda x: sum(system_prompt_scores[x]) / len(system_prompt_scores[x]) if system_prompt_scores[x] else 0)
-        best_score = sum(system_prompt_scores[best_system_prompt]) / len(system_prompt_scores[best_system_prompt]) if system_prompt_scores[best_system_prompt] else 0
-
-        print(f"\n🏆 WINNER: {best_system_prompt.upper()} with {best_score:.2%} average score")
+                print(f"   Average score: {summary['mean'][i]:.2%} "
+                      f"({summary['confidence']:.0%} CI {summary['ci_low'][i]:.2%}-{summary['ci_high'][i]:.2%})")
+                print(f"   Success rate (≥99%): {summary['success_rate'][i]:.2%}")  # Avoid float equality
+                print(f"   Test cases: {summary['count'][i]}")
+
+        if summary['category_means']:
+            print("\n🎭 Average score by persona category:")
+            print_category_breakdown(summary)
+
+        if self.limiter:
+            print(f"\n🎚️  Adaptive concurrency: {format_window(self.limiter.snapshot())}")
+
+    def get_best_prompt(self, summary):
+        """Determine best system prompt, reporting whether its lead is statistically significant"""
+        from utils.stats import print_significance
+
+        if summary['winner'] is None:
+            best_system_prompt = summary['names'][0]
+            print(f"\n🏆 WINNER: {best_system_prompt.upper()} with 0.00% average score")
+            return best_system_prompt
+
+        best_system_prompt = summary['names'][summary['winner']]
+        best_score = summary['mean'][summary['winner']]
+
+        if summary['significant']:
+            print(f"\n🏆 WINNER: {best_system_prompt.upper()} with {best_score:.2%} average score")
+        else:
+            print(f"\n🏆 LEADER: {best_system_prompt.upper()} with {best_score:.2%} average score "
+                  f"(not significantly better than every other prompt)")
+        print_significance(summary)
         return best_system_prompt
 
     def show_best_system_prompt(self, best_system_prompt_name):
@@ -659,51 +1439,382 @@ class PromptEval:
 
 
 
+def _rescore_range(path, start, end):
+    """Worker: rescore the stored outputs in one byte range of a results file with both
+    heuristic scorers (PromptEval.evaluate_response and MovieEvaluator.score_output).
+
+    Returns ([(system prompt, user input, category, heuristic score, strict score)],
+    skipped records).
+    """
+    from movie_evaluator import MovieEvaluator
+    from utils.results import read_jsonl_range
+
+    heuristic = PromptEval()
+    strict = MovieEvaluator()
+    rows = []
+    skipped = 0
+    for record in read_jsonl_range(path, start, end):
+        output = record.get('raw_output')
+        system_name = record.get('system_prompt_name')
+        if not isinstance(output, str) or system_name is None:
+            skipped += 1
+            continue
+        user_input = record.get('user_input', '')
+        rows.append((system_name, user_input, record.get('category', 'unknown'),
+                     heuristic.evaluate_response(output, "", user_input)['quality_score'],
+                     strict.score_output(output)['quality_score']))
+    return rows, skipped
+
+
+def rescore(paths, workers=None, chunk_bytes=RESCORE_CHUNK_BYTES):
+    """Rescore stored raw outputs from previous runs without calling the API.
+
+    The results files are split into byte ranges that a process pool rescores in
+    parallel; the scores are then summarized as in a heuristic run (PromptEval scorer)
+    and as in movie_evaluator.py (MovieEvaluator scorer). Repeated outputs for the same
+    system prompt and user input count as samples of that cell.
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+    from movie_evaluator import MovieEvaluator
+    from utils.results import jsonl_byte_ranges
+    from utils.stats import summarize
+
+    print("♻️  OFFLINE RESCORING OF STORED OUTPUTS (no API calls)")
+    print("=" * 70)
+    for path in paths:
+        print(f"   • {path}")
+
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    ranges = [chunk for path in paths for chunk in jsonl_byte_ranges(path, chunk_bytes)]
+    cells = {}  # (system prompt, user input) -> ([heuristic scores], [strict scores])
+    categories = {}
+    skipped = 0
+    with span('rescore', files=len(paths), chunks=len(ranges)), \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_rescore_range, *chunk) for chunk in ranges]
+        for n, future in enumerate(futures):
+            rows, chunk_skipped = future.result()
+            futures[n] = None  # Release the finished chunk
+            skipped += chunk_skipped
+            for system_name, user_input, category, heuristic_score, strict_score in rows:
+                cell = cells.setdefault((system_name, user_input), ([], []))
+                cell[0].append(heuristic_score)
+                cell[1].append(strict_score)
+                categories.setdefault(user_input, category)
+    elapsed = time.perf_counter() - started
+
+    rescored = sum(len(h) for h, _ in cells.values())
+    print(f"\n⚡ Rescored {rescored:,} outputs from {len(paths)} files in {elapsed:.1f}s "
+          f"with {workers} processes ({rescored / max(elapsed, 1e-9):,.0f} outputs/s)")
+    if skipped:
+        print(f"   ⚠️ Skipped {skipped:,} records without a stored output")
+    if not cells:
+        print("❌ No stored outputs found to rescore")
+        return None
+
+    names = list(dict.fromkeys(system_name for system_name, _ in cells))
+    personas = list(categories)
+    n_samples = max(len(h) for h, _ in cells.values())
+    name_index = {name: p for p, name in enumerate(names)}
+    persona_index = {user_input: t for t, user_input in enumerate(personas)}
+    heuristic_scores = np.full((len(names), len(personas), n_samples), np.nan)
+    strict_scores = np.full_like(heuristic_scores, np.nan)
+    for (system_name, user_input), (heuristic, strict) in cells.items():
+        p, t = name_index[system_name], persona_index[user_input]
+        heuristic_scores[p, t, :len(heuristic)] = heuristic
+        strict_scores[p, t, :len(strict)] = strict
+
+    # Heuristic scorer, summarized like a heuristic run
+    evaluator = PromptEval()
+    summary = summarize(heuristic_scores, names, categories=[categories[u] for u in personas],
+                        n_boot=BOOTSTRAP_RESAMPLES, confidence=CONFIDENCE_LEVEL, alpha=SIGNIFICANCE_LEVEL)
+    evaluator.show_summary(summary)
+    best_system_prompt = evaluator.get_best_prompt(summary)
+
+    # Strict scorer (exactly 3 movies with title/genre/reason), summarized like movie_evaluator.py
+    print("\n" + "=" * 60)
+    print("📊 FINAL SUMMARY - MOVIE EVALUATOR SCORING")
+    print("=" * 60)
+    aggregates = {}
+    for p, system_name in enumerate(names):
+        values = strict_scores[p][~np.isnan(strict_scores[p])]
+        aggregates[system_name] = {'avg_score': float(values.mean()), 'success_rate': float((values >= 1.0).mean()),
+                                   'count': int(values.size)}
+    best_strict = MovieEvaluator().show_summary(aggregates, names=names)
+
+    return {"best_system_prompt": best_system_prompt, "best_strict_prompt": best_strict}
+
+
+def load_test(prompt_name, duration=LOADTEST_DURATION, qps=None, concurrency=MAX_CONCURRENCY, structured=False):
+    """Replay the persona dataset against one system prompt under sustained load.
+
+    Requests are sent at `qps` (open loop) or from `concurrency` clients (closed loop)
+    for `duration` seconds, without retries, so 429s and errors show up as they would
+    for production traffic. Point OPENAI_BASE_URL (or --base-url) at an
+    OpenAI-compatible server to test a local stand-in.
+    """
+    from openai import OpenAI
+    from utils.loadtest import print_load_report, run_load
+    from utils.structured import RESPONSE_FORMAT
+
+    evaluator = PromptEval(dedup=False)
+    system_prompt = evaluator.system_prompts[prompt_name]
+    inputs = [test_case['user_input'] for test_case in evaluator.dataset['test_cases']]
+    client = OpenAI(max_retries=0, timeout=LOADTEST_TIMEOUT)
+    extra = {'response_format': RESPONSE_FORMAT} if structured else {}
+
+    def send(user_input):
+        response = client.chat.completions.create(
+            model=GENERATION_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input},
+            ],
+            temperature=0.7,
+            max_tokens=GENERATION_MAX_TOKENS,
+            **extra,
+        )
+        usage = getattr(response, 'usage', None)
+        return (usage.total_tokens, usage.completion_tokens) if usage else (0, 0)
+
+    print("📈 LOAD TEST OF A SYSTEM PROMPT")
+    print("=" * 70)
+    print(f"🎯 System prompt: {prompt_name.upper()} ({GENERATION_MODEL} at {client.base_url})")
+    print(f"📝 Replaying {len(inputs)} personas "
+          + (f"at {qps:g} QPS" if qps else f"from {concurrency} concurrent clients") + f" for {duration:g}s")
+
+    with span('loadtest', prompt=prompt_name, qps=qps, concurrency=None if qps else concurrency):
+        report = run_load(send, inputs, duration, qps=qps, concurrency=concurrency,
+                          max_in_flight=LOADTEST_MAX_IN_FLIGHT)
+    print_load_report(report)
+    return report
+
+
+def validate_api_key():
+    """Validate the OpenAI API key with a model lookup, which costs no tokens"""
+    from openai import OpenAI
+
+    try:
+        OpenAI().models.retrieve(GENERATION_MODEL)
+        return True
+    except Exception as e:
+        print(f"❌ API key validation failed: {str(e)}")
+        return False
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Evaluate movie recommendation system prompts with the OpenAI API")
+    parser.add_argument("eval_type", nargs="?", default="heuristic",
+                        choices=["heuristic", "llm-judge", "rescore", "loadtest"],
+                        help="'heuristic' for rule-based evaluation, 'llm-judge' for LLM-as-judge evaluation, "
+                             "'rescore' to re-apply the heuristic scorers to stored outputs (no API calls), "
+                             "'loadtest' to benchmark one system prompt under sustained load")
+    parser.add_argument("paths", nargs="*",
+                        help="rescore only: results files to rescore (default: every results/evaluation_results_*.jsonl)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="rescore only: worker processes (default: one per CPU)")
+    parser.add_argument("--prompt",
+                        help="loadtest only: name of the system prompt to load test (e.g. the winner of a run)")
+    parser.add_argument("--qps", type=float, default=None,
+                        help="loadtest only: target requests per second (open loop); "
+                             "without it, --concurrency clients send back to back (closed loop)")
+    parser.add_argument("--duration", type=float, default=LOADTEST_DURATION,
+                        help=f"loadtest only: seconds of sustained load (default: {LOADTEST_DURATION:g})")
+    parser.add_argument("--base-url",
+                        help="OpenAI-compatible API base URL (default: $OPENAI_BASE_URL or the OpenAI API)")
+    parser.add_argument("--plan", action="store_true",
+                        help="heuristic/llm-judge only: print grid size, estimated tokens, cost and wall time, "
+                             "then exit without calling the API")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help=f"upper bound of the adaptive concurrency window (default: {MAX_CONCURRENCY})")
+    parser.add_argument("--samples", type=int, default=SAMPLES_PER_CELL,
+                        help=f"generations per system prompt and test case (default: {SAMPLES_PER_CELL})")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="evaluate every test case instead of collapsing near-duplicate user inputs")
+    parser.add_argument("--hedge", action="store_true",
+                        help="llm-judge only: duplicate generation/judge calls slower than the stage's "
+                             f"p{HEDGE_PERCENTILE} latency (at most {HEDGE_MAX_EXTRA_FRACTION * 100:.0f}%% extra requests)")
+    parser.add_argument("--pairwise", action="store_true",
+                        help="llm-judge only: rank system prompts per persona with a pairwise judge tournament "
+                             "(O(N log N) comparisons) and report Bradley-Terry/Elo ratings")
+    parser.add_argument("--halving", action="store_true",
+                        help="llm-judge only: successive-halving search - evaluate all prompts on a few personas, "
+                             f"keep the best 1/{HALVING_ETA} and re-evaluate the survivors on more personas")
+    parser.add_argument("--gate", action="store_true",
+                        help="llm-judge only: skip the judge for outputs failing the structural heuristics "
+                             f"(valid JSON, 3 items, required fields) and score them {GATE_FLOOR_SCORE:.2f}")
+    parser.add_argument("--structured", action="store_true",
+                        help="request JSON constrained to the {movies: [{title, genre, reason}]} schema "
+                             "(response_format); models without support get bounded repair retries")
+    parser.add_argument("--trace", action="store_true",
+                        help="record phase and API call spans and write a Chrome trace-event JSON file to results/")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile and dump the stats to results/")
+    # Intermixed so options may come between the mode and the results files
+    args = parser.parse_intermixed_args(argv)
+    if args.paths and args.eval_type != "rescore":
+        parser.error("results files can only be given to 'rescore'")
+    missing = [path for path in args.paths if not Path(path).is_file()]
+    if missing:
+        parser.error(f"results file(s) not found: {', '.join(missing)}")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.plan and args.eval_type in ("rescore", "loadtest"):
+        parser.error(f"--plan only applies to 'heuristic' and 'llm-judge' ({args.eval_type} is not planned)")
+    if args.eval_type == "loadtest" and not args.prompt:
+        parser.error("loadtest needs --prompt NAME (a file in prompt_evaluator/system_prompts/)")
+    if args.qps is not None and args.qps <= 0:
+        parser.error("--qps must be positive")
+    if args.gate and args.pairwise:
+        parser.error("--gate cannot be combined with --pairwise (the tournament makes no absolute judge calls)")
+    if args.halving and args.pairwise:
+        parser.error("--halving cannot be combined with --pairwise (tournament ranks are relative to each round)")
+    return args
+
 
 def main():
     """Main function - runs evaluation with OpenAI API"""
-    if not os.getenv('OPENAI_API_KEY'):
-        print("❌ Error: OPENAI_API_KEY not found in .env file")
+    args = parse_args()
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Tracing and profiling cover every mode; the files are written even if the run fails
+    tracer = enable_tracing() if args.trace and not args.plan else None
+    profiler = None
+    if args.profile and not args.plan:
+        from utils.profiling import ThreadProfiler
+        profiler = ThreadProfiler()
+        profiler.start()
+    try:
+        run(args, timestamp)
+    finally:
+        if profiler:
+            profiler.stop()
+            profile_file = f"results/profile_{args.eval_type}_{timestamp}.prof"
+            Path(profile_file).parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(profile_file)
+            print(f"💾 Profile saved to: {profile_file} (python -m pstats {profile_file})")
+        if tracer:
+            trace_file = f"results/trace_{args.eval_type}_{timestamp}.json"
+            tracer.write(trace_file)
+            print(f"💾 Trace saved to: {trace_file} (open in chrome://tracing or https://ui.perfetto.dev)")
+
+
+def run(args, timestamp):
+    """Run the mode selected on the command line"""
+    eval_type = args.eval_type
+
+    if eval_type == "rescore":
+        paths = args.paths or sorted(str(p) for p in Path("results").glob("evaluation_results_*.jsonl"))
+        output_file = f"results/rescore_report_{timestamp}.txt"
+        with TeeOutput(output_file):
+            rescore(paths, workers=args.workers)
+        print(f"\n💾 Report saved to: {output_file}")
+        return
+
+    if eval_type == "loadtest":
+        available = PromptEval().load_system_prompts()
+        if args.prompt not in available:
+            print(f"❌ Unknown system prompt '{args.prompt}' (available: {', '.join(sorted(available))})")
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not os.getenv('OPENAI_API_KEY'):
+            print("❌ Error: OPENAI_API_KEY not found in .env file")
+            return
+        if not validate_api_key():
+            return
+        output_file = f"results/loadtest_report_{args.prompt}_{timestamp}.txt"
+        with TeeOutput(output_file):
+            load_test(args.prompt, duration=args.duration, qps=args.qps, concurrency=max(1, args.concurrency),
+                      structured=args.structured)
+        print(f"\n💾 Report saved to: {output_file}")
         return
 
+    max_concurrency = max(1, args.concurrency)
+    limiter = AIMDLimiter(initial=min(INITIAL_CONCURRENCY, max_concurrency), max_limit=max_concurrency)
+    resilience = ResilientCaller(max_attempts=MAX_RETRIES, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                                 budget_ratio=RETRY_BUDGET_RATIO, budget_min=RETRY_BUDGET_MIN,
+                                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN)
+    structured = StructuredOutput(enabled=args.structured, repair_attempts=STRUCTURED_REPAIR_ATTEMPTS)
+
+    if eval_type == "heuristic":
+        evaluator = PromptEval(limiter=limiter, samples=max(1, args.samples), dedup=not args.no_dedup,
+                               resilience=resilience, structured=structured)
+    else:
+        hedge_policy = None
+        if args.hedge:
+            hedge_policy = HedgePolicy(percentile=HEDGE_PERCENTILE,
+                                       max_extra_fraction=HEDGE_MAX_EXTRA_FRACTION,
+                                       min_samples=HEDGE_MIN_SAMPLES,
+                                       max_workers=2 * max_concurrency)
+        evaluator = LLMJudgeEval(hedge_policy=hedge_policy, limiter=limiter, samples=max(1, args.samples),
+                                 dedup=not args.no_dedup, pairwise=args.pairwise, halving=args.halving,
+                                 resilience=resilience, structured=structured, gate=args.gate)
+
+    if args.plan:
+        print_plan(evaluator.plan(max_concurrency))
+        return
 
-    # Choose evaluation type
-    import sys
-    eval_type = sys.argv[1] if len(sys.argv) > 1 else "heuristic"
+    from dotenv import load_dotenv
+    load_dotenv()
 
-    if eval_type not in ["heuristic", "llm-judge"]:
-        print("❌ Invalid evaluation type. Use: 'heuristic' or 'llm-judge'")
+    if not os.getenv('OPENAI_API_KEY'):
+        print("❌ Error: OPENAI_API_KEY not found in .env file")
         return
 
+    # Validate the API key while prompt files and the dataset are loaded
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        key_check = pool.submit(validate_api_key)
+        with span('load_assets'):
+            evaluator.preload()
+        if not key_check.result():
+            return
+
     # Create output file with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = f"results/evaluation_report_{eval_type}_{timestamp}.txt"
+    results_file = f"results/evaluation_results_{eval_type}_{timestamp}.jsonl"
 
-    with TeeOutput(output_file):
+    with TeeOutput(output_file), span('run', eval_type=eval_type):
         if eval_type == "heuristic":
             print("🚀 Using HEURISTIC evaluation with OpenAI API")
             print("🎯 Evaluation criteria: JSON validity, item count, field completeness")
             print()
 
-            # Initialize and run heuristic evaluation
-            evaluator = PromptEval()
-            evaluator.run()
+            # Run heuristic evaluation
+            evaluator.run(results_file)
 
         elif eval_type == "llm-judge":
             print("🤖 Using LLM-AS-JUDGE evaluation with OpenAI API")
             print("🎯 One model generates recommendations, another model judges quality")
             print()
 
-            # Initialize and run LLM-judge evaluation
-            evaluator = LLMJudgeEval()
-            evaluator.run()
+            # Run LLM-judge evaluation
+            evaluator.run(results_file)
+            if evaluator.hedge_policy:
+                evaluator.hedge_policy.shutdown()
 
         print(f"\n✨ {eval_type.upper()} evaluation completed with OpenAI API!")
 
     print(f"\n💾 Report saved to: {output_file}")
+    print(f"💾 Raw results saved to: {results_file}")
     print("\n💡 Usage:")
     print("   python movie_evaluator_with_evals.py heuristic  # Rule-based evaluation")
     print("   python movie_evaluator_with_evals.py llm-judge  # LLM-as-judge evaluation")
+    print("   python movie_evaluator_with_evals.py llm-judge --plan  # Estimate cost and time, no API calls")
+    print("   python movie_evaluator_with_evals.py llm-judge --pairwise  # Rank prompts with a pairwise tournament")
+    print("   python movie_evaluator_with_evals.py llm-judge --gate  # Skip judge calls for malformed outputs")
+    print("   python movie_evaluator_with_evals.py llm-judge --halving  # Find the best prompt of a large pool cheaply")
+    print("   python movie_evaluator_with_evals.py heuristic --structured  # Schema-constrained JSON outputs")
+    print("   python movie_evaluator_with_evals.py rescore  # Rescore stored outputs after changing the heuristics")
+    print("   python movie_evaluator_with_evals.py loadtest --prompt expert --qps 5  # Benchmark a prompt under load")
+    print("   python movie_evaluator_with_evals.py llm-judge --trace  # Write a Chrome trace of phases and API calls")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""
+Load test against a local OpenAI-compatible stub: every 4th chat completion is rejected
+with a 429, the rest succeed after a short delay
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from movie_evaluator_with_evals import load_test
+from utils.loadtest import LATENCY_PERCENTILES
+
+RATE_LIMIT_EVERY = 4   # every Nth request gets a 429
+RESPONSE_DELAY = 0.01  # seconds before a successful response
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/v1/chat/completions':
+            self._send(404, {'error': {'message': 'not found'}})
+            return
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            rate_limited = server.requests % RATE_LIMIT_EVERY == 0
+            server.rate_limited += rate_limited
+        if rate_limited:
+            self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                       'code': 'rate_limit_exceeded'}})
+            return
+        time.sleep(RESPONSE_DELAY)
+        content = json.dumps({'movies': [{'title': 'Alien', 'genre': 'sci-fi', 'reason': 'classic'}] * 3})
+        self._send(200, {
+            'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': 'stub',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 30, 'completion_tokens': 20, 'total_tokens': 50},
+        })
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = server.rate_limited = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}/v1')
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def assert_counts(report, server):
+    assert report['completed'] == server.requests > 0
+    assert report['rate_limited'] == server.rate_limited > 0
+    assert report['errors'] == {}
+    assert report['ok'] + report['rate_limited'] + sum(report['errors'].values()) == report['completed']
+    assert set(report['latency']) == set(LATENCY_PERCENTILES) | {'mean', 'max'}
+    assert RESPONSE_DELAY <= report['latency'][50] <= report['latency']['max']
+    assert report['tokens_per_second'] > report['completion_tokens_per_second'] > 0
+
+
+def test_open_loop(stub_server):
+    report = load_test('basic', duration=1.0, qps=20)
+    assert report['mode'] == 'open loop, 20 QPS target'
+    assert report['sent'] == 20
+    assert report['dropped'] == 0
+    assert_counts(report, stub_server)
+
+
+def test_closed_loop(stub_server):
+    report = load_test('basic', duration=0.5, concurrency=2)
+    assert report['mode'] == 'closed loop, 2 concurrent clients'
+    assert report['sent'] == report['completed']
+    assert_counts(report, stub_server)
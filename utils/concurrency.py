@@ -0,0 +1,129 @@
+"""
+Adaptive concurrency limiting (AIMD) shared by every API call site
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+
+def is_rate_limit_error(error):
+    """True for HTTP 429 / RateLimitError exceptions, without importing openai"""
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def submit_ahead(keys, submit, window):
+    """Yield (key, submit(key)) for every key in order, calling `submit` at most `window`
+    keys ahead of the consumer.
+
+    `submit` starts the work for a key (e.g. returns pool futures), so only a bounded
+    number of pending futures and unread results exist at a time, whatever the grid size.
+    """
+    keys = iter(keys)
+    pending = deque((key, submit(key)) for key in itertools.islice(keys, max(1, window)))
+    while pending:
+        item = pending.popleft()
+        # Refill before handing the item over so the pool stays busy while it is consumed
+        pending.extend((key, submit(key)) for key in itertools.islice(keys, 1))
+        yield item
+
+
+class AIMDLimiter:
+    """Limit in-flight requests with an additive-increase / multiplicative-decrease window.
+
+    Every successful call whose latency stays within `latency_tolerance` times the
+    smoothed latency of its stage grows the window by `increase / window` (about +1 per
+    window of calls). A 429 or a latency spike shrinks it by `decrease`; requests that
+    started before the last decrease do not shrink it again, so one congestion event
+    halves the window only once.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=8, increase=1.0, decrease=0.5,
+                 latency_tolerance=2.0, smoothing=0.2):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._baselines = {}  # stage -> smoothed latency
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._stats = {
+            'calls': 0,
+            'rate_limited': 0,
+            'latency_spikes': 0,
+            'decreases': 0,
+            'min_window': int(self._limit),
+            'max_window': int(self._limit),
+        }
+
+    @property
+    def window(self):
+        """Current number of requests allowed in flight"""
+        return int(self._limit)
+
+    def acquire(self):
+        """Block until a slot in the window is free; returns the acquisition time"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+            return time.monotonic()
+
+    def release(self, stage, started, latency=None, overloaded=False):
+        """Free a slot and adapt the window to the outcome of the call"""
+        with self._cond:
+            self._in_flight -= 1
+            self._stats['calls'] += 1
+
+            spike = False
+            if latency is not None:
+                baseline = self._baselines.get(stage)
+                spike = baseline is not None and latency > self.latency_tolerance * baseline
+                if spike:
+                    self._stats['latency_spikes'] += 1
+                self._baselines[stage] = latency if baseline is None else (
+                    self.smoothing * latency + (1 - self.smoothing) * baseline)
+            if overloaded:
+                self._stats['rate_limited'] += 1
+
+            if overloaded or spike:
+                if started >= self._last_decrease:
+                    self._limit = max(self.min_limit, self._limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+                    self._stats['decreases'] += 1
+            elif latency is not None:
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+
+            window = int(self._limit)
+            self._stats['min_window'] = min(self._stats['min_window'], window)
+            self._stats['max_window'] = max(self._stats['max_window'], window)
+            self._cond.notify_all()
+
+    def run(self, stage, fn):
+        """Run fn() (a blocking API call) inside the window"""
+        started = self.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            self.release(stage, started, overloaded=is_rate_limit_error(e))
+            raise
+        self.release(stage, started, latency=time.monotonic() - started)
+        return result
+
+    def snapshot(self):
+        """Current window and adaptation counters"""
+        with self._cond:
+            return dict(self._stats, window=int(self._limit), in_flight=self._in_flight,
+                        max_limit=self.max_limit)
+
+
+def format_window(snapshot):
+    """One-line summary of an AIMDLimiter snapshot"""
+    return (f"window {snapshot['window']}/{snapshot['max_limit']} "
+            f"(range {snapshot['min_window']}-{snapshot['max_window']}, "
+            f"{snapshot['decreases']} backoffs: {snapshot['rate_limited']} rate limits, "
+            f"{snapshot['latency_spikes']} latency spikes)")
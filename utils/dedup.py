@@ -0,0 +1,100 @@
+"""
+Offline near-duplicate detection for test cases (MinHash signatures + LSH banding)
+"""
+import re
+import zlib
+
+import numpy as np
+
+_PRIME = (1 << 31) - 1  # Mersenne prime; keeps (a * x + b) within uint64
+
+
+def shingles(text, size=3):
+    """Set of word n-gram shingles of a normalized text"""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=3, seed=0):
+    """MinHash signature matrix (len(texts) × num_perm) of the texts' shingle sets"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) & _PRIME for s in shingles(text, shingle_size)),
+                             dtype=np.uint64)
+        signatures[row] = ((a * hashes[None, :] + b) % _PRIME).min(axis=1)
+    return signatures
+
+
+def _lsh_bands(num_perm, threshold):
+    """Pick (bands, rows) with bands * rows == num_perm whose S-curve midpoint is closest to threshold"""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+def near_duplicate_clusters(texts, threshold=0.8, num_perm=64, shingle_size=3):
+    """Group texts whose estimated Jaccard similarity reaches the threshold.
+
+    Returns a list of clusters (lists of indices, each in input order), ordered by
+    their first member. Candidate pairs come from LSH buckets, so the cost grows with
+    the number of texts rather than the number of pairs.
+    """
+    if not texts:
+        return []
+    signatures = minhash_signatures(texts, num_perm, shingle_size)
+    bands, rows = _lsh_bands(num_perm, threshold)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for n, i in enumerate(members):
+                for j in members[n + 1:]:
+                    root_i, root_j = find(i), find(j)
+                    if root_i == root_j or (i, j) in checked:
+                        continue
+                    checked.add((i, j))
+                    if np.mean(signatures[i] == signatures[j]) >= threshold:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda c: c[0])
+
+
+def dedup_dataset(dataset, threshold=0.8, num_perm=64, key='user_input'):
+    """Collapse near-duplicate test cases onto cluster representatives.
+
+    The first member of each cluster is kept and gets a 'cluster_size' field (used to
+    reweight reports); dataset['dedup'] records the original count and, for each kept
+    test case, the original indices it stands for.
+    """
+    test_cases = dataset['test_cases']
+    clusters = near_duplicate_clusters([tc[key] for tc in test_cases], threshold, num_perm)
+
+    representatives = []
+    for members in clusters:
+        representative = dict(test_cases[members[0]], cluster_size=len(members))
+        representatives.append(representative)
+
+    return dict(dataset, test_cases=representatives, dedup={
+        'original_count': len(test_cases),
+        'threshold': threshold,
+        'clusters': clusters,
+    })
@@ -0,0 +1,173 @@
+"""
+Hedged requests: when a call outlives the usual latency of its stage, fire a duplicate
+and keep whichever copy finishes first
+"""
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a sequence of numbers, None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class HedgePolicy:
+    """Hedge slow API calls, learning the hedge threshold per stage.
+
+    A call that has not returned after the observed `percentile` latency of its stage gets
+    a duplicate request; the first copy to finish wins and the other is cancelled (if it
+    has not started yet) or its result is discarded. Hedges are capped at
+    `max_extra_fraction` of the calls of each stage and only start once `min_samples`
+    latencies have been observed. The reported p99s come from reservoir samples of up to
+    `sample_size` latencies per stage, so memory stays constant however many calls run.
+    """
+
+    def __init__(self, percentile=95, max_extra_fraction=0.1, min_samples=5, window=200, max_workers=None,
+                 sample_size=2000, seed=0):
+        self.percentile = percentile
+        self.max_extra_fraction = max_extra_fraction
+        self.min_samples = min_samples
+        self.window = window
+        self.sample_size = sample_size
+        self._rng = random.Random(seed)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, stage):
+        # Caller must hold self._lock
+        if stage not in self._stages:
+            self._stages[stage] = {
+                'recent': deque(maxlen=self.window),  # primary latencies that drive the threshold
+                'calls': 0,
+                'hedges': 0,
+                'hedge_wins': 0,
+                'unhedged_latencies': {'seen': 0, 'items': []},  # when each primary request finished
+                'latencies': {'seen': 0, 'items': []},           # when the caller got its answer
+            }
+        return self._stages[stage]
+
+    def _sample(self, reservoir, latency):
+        """Add a latency to a reservoir sample (Algorithm R); caller must hold self._lock"""
+        reservoir['seen'] += 1
+        if len(reservoir['items']) < self.sample_size:
+            reservoir['items'].append(latency)
+        else:
+            slot = self._rng.randrange(reservoir['seen'])
+            if slot < self.sample_size:
+                reservoir['items'][slot] = latency
+
+    def hedge_delay(self, stage):
+        """Seconds to wait before hedging a call of this stage, None while still warming up"""
+        with self._lock:
+            recent = list(self._stage(stage)['recent'])
+        if len(recent) < self.min_samples:
+            return None
+        return percentile(recent, self.percentile)
+
+    def _record_primary(self, stage, started):
+        def callback(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            latency = time.perf_counter() - started[0]
+            with self._lock:
+                stats = self._stage(stage)
+                stats['recent'].append(latency)
+                self._sample(stats['unhedged_latencies'], latency)
+        return callback
+
+    def _reserve_hedge(self, stage):
+        with self._lock:
+            stats = self._stage(stage)
+            if stats['hedges'] + 1 > self.max_extra_fraction * stats['calls']:
+                return False
+            stats['hedges'] += 1
+            return True
+
+    def call(self, stage, fn):
+        """Run fn() (a blocking API call) with hedging and return its result.
+
+        fn should be the API call alone: the latencies that set the hedge threshold must
+        not include time spent waiting for a concurrency slot.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._stage(stage)['calls'] += 1
+        delay = self.hedge_delay(stage)
+
+        # The primary's latency is timed from when a worker actually starts it
+        started = [start]
+
+        def timed():
+            started[0] = time.perf_counter()
+            return fn()
+
+        primary = self._executor.submit(timed)
+        primary.add_done_callback(self._record_primary(stage, started))
+
+        try:
+            if delay is None or wait([primary], timeout=delay).done or not self._reserve_hedge(stage):
+                return primary.result()
+
+            hedge = self._executor.submit(fn)
+            pending = {primary, hedge}
+            first_error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Prefer the primary if both finished together
+                for future in sorted(done, key=lambda f: f is not primary):
+                    if future.exception() is None:
+                        for loser in pending:
+                            loser.cancel()
+                        if future is hedge:
+                            with self._lock:
+                                self._stage(stage)['hedge_wins'] += 1
+                        return future.result()
+                    first_error = first_error or future.exception()
+            raise first_error
+        finally:
+            with self._lock:
+                self._sample(self._stage(stage)['latencies'], time.perf_counter() - start)
+
+    def report(self):
+        """Per-stage hedge rate and p99 latency with and without hedging"""
+        with self._lock:
+            report = {}
+            for stage, stats in self._stages.items():
+                report[stage] = {
+                    'calls': stats['calls'],
+                    'hedges': stats['hedges'],
+                    'hedge_rate': stats['hedges'] / stats['calls'] if stats['calls'] else 0.0,
+                    'hedge_wins': stats['hedge_wins'],
+                    'threshold': percentile(list(stats['recent']), self.percentile),
+                    'p99_unhedged': percentile(stats['unhedged_latencies']['items'], 99),
+                    'p99_hedged': percentile(stats['latencies']['items'], 99),
+                }
+            return report
+
+    def shutdown(self):
+        """Stop the worker threads without waiting for discarded duplicates"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def print_hedge_report(report):
+    """Print the output of HedgePolicy.report()"""
+    print("\n🪃 HEDGED REQUESTS")
+    print(f"{'─' * 80}")
+    print(f"{'Stage':<12} {'Calls':>6} {'Hedges':>7} {'Rate':>7} {'Wins':>5} {'Threshold':>10} {'p99 before':>11} {'p99 after':>10}")
+    for stage, stats in report.items():
+        def fmt(value):
+            return f"{value:.2f}s" if value is not None else "n/a"
+        print(f"{stage:<12} {stats['calls']:>6} {stats['hedges']:>7} {stats['hedge_rate']:>7.1%} "
+              f"{stats['hedge_wins']:>5} {fmt(stats['threshold']):>10} {fmt(stats['p99_unhedged']):>11} "
+              f"{fmt(stats['p99_hedged']):>10}")
+    print(f"{'─' * 80}")
+    print("   p99 before = primary requests alone, p99 after = latency seen by the evaluator")
@@ -0,0 +1,121 @@
+"""
+Sustained-load benchmark: send requests at a target rate (open loop) or from a fixed number
+of concurrent clients (closed loop) for a fixed duration and report throughput, latency
+percentiles, error and rate-limit rates and token throughput
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.concurrency import is_rate_limit_error
+
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+def run_load(send, inputs, duration, qps=None, concurrency=8, max_in_flight=256):
+    """Call `send(user_input)` for `duration` seconds, cycling through `inputs`.
+
+    `send` returns (total_tokens, completion_tokens) of a successful request and raises
+    on failure. With `qps`, requests start on a fixed schedule whatever the latency
+    (open loop, at most `max_in_flight` at a time); latency is measured from the scheduled
+    start, so time spent queued behind slow requests counts. Requests still queued when
+    the duration ends are dropped. Without `qps`, `concurrency` clients each send their
+    next request as soon as the previous one completes (closed loop).
+    """
+    samples = []
+    lock = threading.Lock()
+    counter = itertools.count()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def one(scheduled):
+        if qps and time.perf_counter() >= deadline:
+            # Queued behind slow requests until the test ended
+            return
+        user_input = inputs[next(counter) % len(inputs)]
+        tokens = (0, 0)
+        try:
+            tokens = send(user_input)
+            outcome = 'ok'
+        except Exception as e:
+            outcome = 'rate_limited' if is_rate_limit_error(e) else type(e).__name__
+        sample = {'latency': time.perf_counter() - scheduled, 'outcome': outcome,
+                  'total_tokens': tokens[0], 'completion_tokens': tokens[1]}
+        with lock:
+            samples.append(sample)
+
+    if qps:
+        interval = 1.0 / qps
+        pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='load')
+        sent = 0
+        while start + sent * interval < deadline:
+            scheduled = start + sent * interval
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            pool.submit(one, scheduled)
+            sent += 1
+        pool.shutdown(wait=True)
+    else:
+        def client():
+            while time.perf_counter() < deadline:
+                one(time.perf_counter())
+
+        clients = [threading.Thread(target=client, name=f'load-{n}') for n in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        sent = len(samples)
+
+    return summarize_load(samples, sent, time.perf_counter() - start, duration, qps, concurrency)
+
+
+def summarize_load(samples, sent, elapsed, duration, qps=None, concurrency=None):
+    """Aggregate request samples into the load test report"""
+    ok = [s for s in samples if s['outcome'] == 'ok']
+    latencies = np.array([s['latency'] for s in ok])
+    errors = {}
+    for s in samples:
+        if s['outcome'] not in ('ok', 'rate_limited'):
+            errors[s['outcome']] = errors.get(s['outcome'], 0) + 1
+    completed = len(samples)
+    return {
+        'mode': f"open loop, {qps:g} QPS target" if qps else f"closed loop, {concurrency} concurrent clients",
+        'duration': duration,
+        'elapsed': elapsed,
+        'sent': sent,
+        'completed': completed,
+        'dropped': sent - completed,
+        'ok': len(ok),
+        'rate_limited': sum(s['outcome'] == 'rate_limited' for s in samples),
+        'errors': errors,
+        'throughput': len(ok) / elapsed if elapsed else 0.0,
+        'offered_qps': sent / duration if duration else 0.0,
+        'latency': ({p: float(np.percentile(latencies, p)) for p in LATENCY_PERCENTILES}
+                    | {'mean': float(latencies.mean()), 'max': float(latencies.max())}) if len(ok) else {},
+        'tokens_per_second': sum(s['total_tokens'] for s in ok) / elapsed if elapsed else 0.0,
+        'completion_tokens_per_second': sum(s['completion_tokens'] for s in ok) / elapsed if elapsed else 0.0,
+    }
+
+
+def print_load_report(report):
+    """Print the load test report"""
+    completed = max(1, report['completed'])
+    n_errors = sum(report['errors'].values())
+    print("\n📈 LOAD TEST RESULTS:")
+    print(f"   Mode: {report['mode']} for {report['duration']:g}s ({report['elapsed']:.1f}s including drain)")
+    print(f"   Requests: {report['sent']} sent ({report['offered_qps']:.2f}/s offered), "
+          f"{report['completed']} completed, {report['dropped']} dropped at the deadline")
+    print(f"   Throughput: {report['throughput']:.2f} successful requests/s")
+    if report['latency']:
+        latency = report['latency']
+        percentiles = "  ".join(f"p{p} {latency[p]:.2f}s" for p in LATENCY_PERCENTILES)
+        print(f"   Latency: {percentiles}  mean {latency['mean']:.2f}s  max {latency['max']:.2f}s")
+    print(f"   Rate limited (429): {report['rate_limited']} ({report['rate_limited'] / completed:.1%})")
+    print(f"   Errors: {n_errors} ({n_errors / completed:.1%})"
+          + (f" - {', '.join(f'{name} ×{count}' for name, count in report['errors'].items())}"
+             if report['errors'] else ""))
+    print(f"   Tokens: {report['tokens_per_second']:.0f}/s total, "
+          f"{report['completion_tokens_per_second']:.0f}/s generated")
@@ -0,0 +1,92 @@
+"""
+Utilities to estimate the size, cost and duration of an evaluation run without calling the API
+"""
+
+
+def estimate_tokens(text):
+    """Rough token estimation (same word-based heuristic used for prompt metrics)"""
+    return len(text.split()) * 1.3
+
+
+def format_duration(seconds):
+    """Format a duration in seconds as a short human readable string"""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {secs:02d}s"
+    if minutes:
+        return f"{minutes}m {secs:02d}s"
+    return f"{secs}s"
+
+
+def build_plan(grid, calls, pricing, concurrency, call_latency):
+    """Aggregate a list of planned API calls into per-stage and total estimates.
+
+    Each call is a dict with 'stage', 'model', 'input_tokens' and 'output_tokens'
+    (the max_tokens of the request, so cost and tokens are upper bounds). Calls may set
+    'serial': True when they run after the grid (e.g. the analysis tail) and 'delay'
+    for a fixed sleep that precedes them.
+    """
+    stages = {}
+    parallel_time = 0.0
+    serial_time = 0.0
+
+    for call in calls:
+        stage = stages.setdefault(call['stage'], {
+            'calls': 0, 'input_tokens': 0.0, 'output_tokens': 0.0, 'cost': 0.0
+        })
+        prices = pricing.get(call['model'], {'input': 0.0, 'output': 0.0})
+        stage['calls'] += 1
+        stage['input_tokens'] += call['input_tokens']
+        stage['output_tokens'] += call['output_tokens']
+        stage['cost'] += (call['input_tokens'] * prices['input'] + call['output_tokens'] * prices['output']) / 1_000_000
+
+        duration = call_latency + call.get('delay', 0.0)
+        if call.get('serial'):
+            serial_time += duration
+        else:
+            parallel_time += duration
+
+    concurrency = max(1, concurrency)
+    return {
+        'grid': grid,
+        'stages': stages,
+        'total_calls': sum(s['calls'] for s in stages.values()),
+        'total_input_tokens': sum(s['input_tokens'] for s in stages.values()),
+        'total_output_tokens': sum(s['output_tokens'] for s in stages.values()),
+        'total_cost': sum(s['cost'] for s in stages.values()),
+        'concurrency': concurrency,
+        'wall_time': parallel_time / concurrency + serial_time,
+        'unpriced_models': sorted({c['model'] for c in calls if c['model'] not in pricing}),
+    }
+
+
+def print_plan(plan):
+    """Print a plan produced by build_plan"""
+    grid = plan['grid']
+    samples = grid.get('samples', 1)
+    sample_label = f" × {samples} samples" if samples > 1 else ""
+    print("📋 RUN PLAN (no API calls made)")
+    print("=" * 70)
+    print(f"   Grid: {grid['prompts']} system prompts × {grid['test_cases']} test cases{sample_label} = "
+          f"{grid['prompts'] * grid['test_cases'] * samples} cells")
+    original = grid.get('original_test_cases')
+    if original and original != grid['test_cases']:
+        print(f"   🧬 Near-duplicates collapsed: {original} → {grid['test_cases']} test cases")
+    evaluated = grid.get('evaluated_cells')
+    if evaluated is not None:
+        print(f"   ✂️  Successive halving: at most {evaluated} of these cells are evaluated")
+    print()
+    print(f"   {'Stage':<12} {'Calls':>7} {'Input tok':>12} {'Output tok':>12} {'Cost (USD)':>12}")
+    print(f"   {'─' * 59}")
+    for name, stage in plan['stages'].items():
+        print(f"   {name:<12} {stage['calls']:>7} {stage['input_tokens']:>12,.0f} "
+              f"{stage['output_tokens']:>12,.0f} {stage['cost']:>12.4f}")
+    print(f"   {'─' * 59}")
+    print(f"   {'total':<12} {plan['total_calls']:>7} {plan['total_input_tokens']:>12,.0f} "
+          f"{plan['total_output_tokens']:>12,.0f} {plan['total_cost']:>12.4f}")
+    print()
+    print(f"   💰 Estimated cost: ${plan['total_cost']:.4f} (upper bound, assumes max_tokens outputs)")
+    print(f"   ⏱️  Estimated wall time: {format_duration(plan['wall_time'])} at concurrency {plan['concurrency']}")
+    if plan['unpriced_models']:
+        print(f"   ⚠️ No pricing configured for: {', '.join(plan['unpriced_models'])}")
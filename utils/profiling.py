@@ -0,0 +1,64 @@
+"""
+cProfile across threads: before Python 3.12 cProfile.Profile only sees the thread that
+enabled it, while the evaluators do their work in thread pools
+"""
+import cProfile
+import pstats
+import sys
+import threading
+
+# Python 3.12+ builds cProfile on sys.monitoring: one profiler sees every thread, and a
+# second one cannot be enabled while it is active
+PER_THREAD = sys.version_info < (3, 12)
+
+
+class ThreadProfiler:
+    """Profile the calling thread and every thread started while profiling.
+
+    On Python 3.12+ a single cProfile.Profile covers all threads. Before that each thread
+    gets its own profile (installed through threading.setprofile when the thread starts)
+    and the profiles are merged when the stats are dumped. Worker processes (e.g. the
+    rescore pool) are not covered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    def _new_profile(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _start_thread(self, frame, event, arg):
+        # Runs on the first event of each new thread and replaces itself with a profile;
+        # a failure must not kill the thread before it runs its target
+        try:
+            self._new_profile()
+        except Exception:
+            sys.setprofile(None)
+
+    def start(self):
+        if PER_THREAD:
+            threading.setprofile(self._start_thread)
+        self._new_profile()
+
+    def stop(self):
+        """Stop profiling new threads and the calling thread"""
+        if PER_THREAD:
+            threading.setprofile(None)
+        self._profiles[0].disable()
+
+    def dump_stats(self, path):
+        """Write the merged stats of every profiled thread (view with python -m pstats)"""
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # A thread that ended before recording any call
+                continue
+        stats.dump_stats(path)
@@ -0,0 +1,229 @@
+"""
+Resilient API calls: retries with server-provided delays (Retry-After / rate-limit reset
+headers) or full-jitter exponential backoff, per-stage retry budgets and circuit breakers
+"""
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from utils.concurrency import is_rate_limit_error
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {'APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError'}
+HINT_JITTER = 0.1  # up to this fraction of a server-requested delay is added as jitter
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the API while a stage's circuit breaker is open"""
+
+
+def is_quota_error(error):
+    """True when the account is out of quota (a 429 that retrying cannot fix)"""
+    return getattr(error, 'code', None) == 'insufficient_quota' or 'insufficient_quota' in str(error).lower()
+
+
+def is_retryable(error):
+    """Transient errors: rate limits (except exhausted quota), timeouts, conflicts,
+    server errors and connection failures"""
+    if is_quota_error(error):
+        return False
+    if is_rate_limit_error(error) or getattr(error, 'status_code', None) in RETRYABLE_STATUS:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def _parse_duration(value):
+    """Seconds in a rate-limit reset header such as '1s', '6m0s', '20ms' or '0.5'"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    return sum(float(amount) * units[unit] for amount, unit in parts) if parts else None
+
+
+def retry_after(error):
+    """Delay in seconds the server asked for, if the error's response carries one.
+
+    Retry-After headers count for any error. The x-ratelimit-reset-* headers only count
+    for rate-limit errors, and only for the limit that is exhausted
+    (x-ratelimit-remaining-* == 0): the other limit's reset is when its bucket is full
+    again, not when a request would be accepted.
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    if headers.get('retry-after'):
+        value = headers['retry-after']
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if not is_rate_limit_error(error):
+        return None
+    resets = []
+    for limit in ('requests', 'tokens'):
+        remaining = headers.get(f'x-ratelimit-remaining-{limit}')
+        reset = headers.get(f'x-ratelimit-reset-{limit}')
+        if remaining is not None and reset and remaining.strip() == '0':
+            resets.append(_parse_duration(reset))
+    resets = [seconds for seconds in resets if seconds is not None]
+    return max(resets) if resets else None
+
+
+class ResilientCaller:
+    """Run API calls with retries shared by every call site.
+
+    A retryable failure is retried after the delay the server asked for (Retry-After,
+    retry-after-ms or the x-ratelimit-reset-* headers) or, without one, after a full-jitter
+    exponential backoff drawn from [0, min(max_delay, base_delay * 2^attempt)].
+    Each stage may spend at most `budget_min + budget_ratio * calls` retries
+    (`stage_budgets` overrides the ratio per stage), so a failing stage cannot multiply
+    the load. After `breaker_threshold` consecutive failed attempts a stage's circuit
+    opens and calls fail fast with CircuitOpenError for `breaker_cooldown` seconds; then a
+    single trial call decides whether it closes again.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, budget_ratio=0.2, budget_min=10,
+                 stage_budgets=None, breaker_threshold=5, breaker_cooldown=30.0, seed=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min = budget_min
+        self.stage_budgets = stage_budgets or {}
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, stage):
+        return self._stages.setdefault(stage, {
+            'calls': 0, 'retries': 0, 'failures': 0, 'wait': 0.0, 'server_delays': 0,
+            'budget_exhausted': 0, 'breaker_opens': 0, 'rejected': 0,
+            'consecutive_failures': 0, 'open_until': 0.0, 'trial_in_flight': False,
+        })
+
+    def _admit(self, stage):
+        """Check the stage's circuit before an attempt; returns True for a half-open trial"""
+        with self._lock:
+            state = self._stage(stage)
+            if state['consecutive_failures'] < self.breaker_threshold:
+                return False
+            if time.monotonic() < state['open_until'] or state['trial_in_flight']:
+                state['rejected'] += 1
+                raise CircuitOpenError(f"circuit open for '{stage}' calls after "
+                                       f"{state['consecutive_failures']} consecutive failures")
+            state['trial_in_flight'] = True
+            return True
+
+    def _record(self, stage, ok, trial):
+        with self._lock:
+            state = self._stage(stage)
+            if trial:
+                state['trial_in_flight'] = False
+            if ok:
+                state['consecutive_failures'] = 0
+                return
+            state['consecutive_failures'] += 1
+            if state['consecutive_failures'] >= self.breaker_threshold:
+                if trial or state['consecutive_failures'] == self.breaker_threshold:
+                    state['breaker_opens'] += 1
+                state['open_until'] = time.monotonic() + self.breaker_cooldown
+
+    def _take_retry(self, stage):
+        """Spend one retry from the stage's budget; False once it is exhausted"""
+        with self._lock:
+            state = self._stage(stage)
+            ratio = self.stage_budgets.get(stage, self.budget_ratio)
+            if state['retries'] >= self.budget_min + ratio * state['calls']:
+                state['budget_exhausted'] += 1
+                return False
+            state['retries'] += 1
+            return True
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (0-based) and whether the server chose it"""
+        hint = retry_after(error) if error is not None else None
+        if hint is not None:
+            # Honour the server's delay; jitter proportional to it keeps waiting threads from
+            # retrying in lockstep without stretching short delays
+            delay = min(self.max_delay, hint)
+            return delay + self._rng.uniform(0, HINT_JITTER * delay), True
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)), False
+
+    def call(self, stage, fn, attempt_info=None):
+        """Run fn() for the given stage, retrying transient failures.
+
+        `attempt_info` (e.g. a trace span's attributes) receives the number of retries
+        and the seconds spent waiting. The last error is raised when retries run out.
+        """
+        with self._lock:
+            self._stage(stage)['calls'] += 1
+        waited = 0.0
+        attempt = 0
+        try:
+            while True:
+                trial = self._admit(stage)
+                try:
+                    result = fn()
+                except Exception as e:
+                    # Only transient errors count towards opening the circuit
+                    self._record(stage, not is_retryable(e), trial)
+                    if (not is_retryable(e) or attempt + 1 >= self.max_attempts
+                            or not self._take_retry(stage)):
+                        raise
+                    delay, from_server = self.backoff(attempt, e)
+                    with self._lock:
+                        state = self._stage(stage)
+                        state['wait'] += delay
+                        state['server_delays'] += from_server
+                    time.sleep(delay)
+                    waited += delay
+                    attempt += 1
+                    continue
+                self._record(stage, True, trial)
+                return result
+        except Exception:
+            with self._lock:
+                self._stage(stage)['failures'] += 1
+            raise
+        finally:
+            if attempt_info is not None:
+                attempt_info['retries'] = attempt
+                attempt_info['waited'] = round(waited, 3)
+
+    def report(self):
+        """Per-stage counters: calls, retries, failures, wait (s), server_delays,
+        budget_exhausted, breaker_opens and rejected (fast failures while open)"""
+        with self._lock:
+            return {stage: {k: v for k, v in state.items()
+                            if k not in ('consecutive_failures', 'open_until', 'trial_in_flight')}
+                    for stage, state in self._stages.items()}
+
+
+def print_retry_report(report):
+    """Print retry counts and time spent waiting per stage"""
+    if not report:
+        return
+    print("\n🔁 RETRIES (Retry-After / full-jitter backoff):")
+    print(f"   {'Stage':<12} {'Calls':>7} {'Retries':>8} {'Failed':>7} {'Waited':>9} {'Server':>7} "
+          f"{'Budget hit':>11} {'Breaker':>8}")
+    for stage, stats in report.items():
+        print(f"   {stage:<12} {stats['calls']:>7} {stats['retries']:>8} {stats['failures']:>7} "
+              f"{stats['wait']:>8.1f}s {stats['server_delays']:>7} {stats['budget_exhausted']:>11} "
+              f"{stats['breaker_opens']:>8}")
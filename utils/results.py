@@ -0,0 +1,112 @@
+"""
+Bounded-memory result handling: stream every result to a JSONL file and keep only running
+aggregates plus a small reservoir of example results per system prompt
+"""
+import json
+import random
+from pathlib import Path
+
+
+class ResultSink:
+    """Collect evaluation results without holding them all in memory.
+
+    Each added result is appended to `path` (JSON Lines) when a path is given. In memory
+    the sink keeps, per system prompt, the count, score sum and number of perfect
+    results, plus reservoir samples (Algorithm R) of up to `reservoir_size` perfect and
+    `reservoir_size` partial results, so memory stays constant however many cells run.
+    Results whose score is None (not scored) are written to the file but not aggregated.
+    """
+
+    def __init__(self, path=None, score_key='quality_score', reservoir_size=2,
+                 perfect_threshold=0.99, seed=0):
+        self.path = Path(path) if path else None
+        self.score_key = score_key
+        self.reservoir_size = reservoir_size
+        self.perfect_threshold = perfect_threshold
+        self._rng = random.Random(seed)
+        self._aggregates = {}
+        self._reservoirs = {}
+        self._file = None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'w', encoding='utf-8')
+
+    def add(self, system_prompt_name, result):
+        """Record one result (a JSON-serializable dict) for a system prompt"""
+        if self._file:
+            self._file.write(json.dumps(dict(result, system_prompt_name=system_prompt_name),
+                                        ensure_ascii=False) + "\n")
+
+        score = result[self.score_key]
+        if score is None:
+            return
+        aggregate = self._aggregates.setdefault(system_prompt_name, {'count': 0, 'sum': 0.0, 'perfect': 0})
+        aggregate['count'] += 1
+        aggregate['sum'] += score
+        if score >= self.perfect_threshold:
+            aggregate['perfect'] += 1
+            self._sample('perfect', system_prompt_name, result)
+        elif score > 0:
+            self._sample('partial', system_prompt_name, result)
+
+    def _sample(self, kind, system_prompt_name, result):
+        reservoir = self._reservoirs.setdefault((kind, system_prompt_name), {'seen': 0, 'items': []})
+        reservoir['seen'] += 1
+        if len(reservoir['items']) < self.reservoir_size:
+            reservoir['items'].append(result)
+        else:
+            slot = self._rng.randrange(reservoir['seen'])
+            if slot < self.reservoir_size:
+                reservoir['items'][slot] = result
+
+    def aggregates(self):
+        """Per system prompt: {'count', 'sum', 'perfect', 'avg_score', 'success_rate'}"""
+        return {
+            name: dict(agg, avg_score=agg['sum'] / agg['count'], success_rate=agg['perfect'] / agg['count'])
+            for name, agg in self._aggregates.items()
+        }
+
+    def examples(self, system_prompt_name=None):
+        """Reservoir examples, perfect ones first (optionally for a single system prompt)"""
+        examples = []
+        for kind in ('perfect', 'partial'):
+            for (reservoir_kind, name), reservoir in self._reservoirs.items():
+                if reservoir_kind == kind and system_prompt_name in (None, name):
+                    examples.extend(reservoir['items'])
+        return examples
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def jsonl_byte_ranges(path, chunk_bytes=8 * 1024 * 1024):
+    """Split a JSON Lines file into (path, start, end) byte ranges of about chunk_bytes,
+    so worker processes can each read their own part of the file"""
+    size = Path(path).stat().st_size
+    return [(str(path), start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+
+
+def read_jsonl_range(path, start, end):
+    """Yield the records of the lines that start inside [start, end) of a JSON Lines file;
+    blank or truncated lines are skipped"""
+    with open(path, 'rb') as f:
+        if start:
+            # Move to the first line starting at or after `start`
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
@@ -0,0 +1,75 @@
+"""
+Successive halving over a pool of candidates: evaluate everyone on a small subset of
+test cases, keep the best fraction and re-evaluate the survivors on larger subsets
+"""
+import math
+import random
+
+
+def stratified_order(categories, seed=0):
+    """Order test case indices so that every prefix covers the categories evenly
+    (round-robin over categories, shuffled within each category)"""
+    rng = random.Random(seed)
+    groups = {}
+    for index, category in enumerate(categories):
+        groups.setdefault(category, []).append(index)
+    for members in groups.values():
+        rng.shuffle(members)
+    order = []
+    while any(groups.values()):
+        for members in groups.values():
+            if members:
+                order.append(members.pop(0))
+    return order
+
+
+def subset_size(round_index, n_items, n_candidates, eta=2, min_items=1):
+    """Number of test cases used in a round: min_items * eta^round, capped at n_items;
+    a single remaining candidate goes straight to the full set"""
+    if n_candidates <= 1:
+        return n_items
+    return min(n_items, min_items * eta ** round_index)
+
+
+def halving_schedule(n_candidates, n_items, eta=2, min_items=1):
+    """Worst-case rounds of a search as [(candidates, test cases)], ending when the
+    survivors have been evaluated on every test case"""
+    rounds = []
+    candidates = n_candidates
+    while candidates:
+        items = subset_size(len(rounds), n_items, candidates, eta, min_items)
+        rounds.append((candidates, items))
+        if items >= n_items:
+            break
+        candidates = max(1, math.ceil(candidates / eta))
+    return rounds
+
+
+def schedule_cells(schedule):
+    """Cells evaluated by a schedule; survivors keep the scores of earlier rounds"""
+    cells = 0
+    previous = 0
+    for candidates, items in schedule:
+        cells += candidates * (items - previous)
+        previous = items
+    return cells
+
+
+def print_halving_report(rounds, cells_run, full_cells):
+    """Print the rounds of a successive-halving search and the budget it saved.
+
+    Each round is a dict with 'candidates', 'items', 'cells', 'means' (candidate -> mean
+    over the round's subset) and 'kept' (candidates promoted to the next round).
+    """
+    print("\n✂️  SUCCESSIVE HALVING:")
+    for number, search_round in enumerate(rounds, 1):
+        eliminated = [c for c in search_round['candidates'] if c not in search_round['kept']]
+        print(f"   Round {number}: {len(search_round['candidates'])} prompts × {search_round['items']} test cases "
+              f"({search_round['cells']} new cells) → kept {len(search_round['kept'])}")
+        if eliminated:
+            scores = ", ".join(f"{name} {search_round['means'][name]:.3f}" for name in eliminated)
+            print(f"      eliminated: {scores}")
+    if full_cells:
+        saved = full_cells - cells_run
+        print(f"   💸 Evaluated {cells_run} of {full_cells} cells of the full grid "
+              f"({saved} saved, {saved / full_cells:.0%} of the budget)")
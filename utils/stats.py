@@ -0,0 +1,176 @@
+"""
+Vectorized score aggregation: means, per-category breakdowns, bootstrap confidence
+intervals and paired significance tests over a (prompt × persona × sample) score array
+"""
+import warnings
+
+import numpy as np
+
+# Cells are grouped into at most this many random, equally sized blocks before
+# resampling, so bootstrap cost no longer grows with the number of scores
+MAX_BLOCKS = 2000
+
+
+def empty_scores(n_prompts, n_personas, n_samples=1):
+    """Score array for a run; cells that are never filled stay NaN (missing)"""
+    return np.full((n_prompts, n_personas, n_samples), np.nan)
+
+
+def _assign_blocks(n_cells, rng):
+    """Randomly assign each cell to one of k equally sized blocks"""
+    k = min(n_cells, MAX_BLOCKS)
+    assignment = np.empty(n_cells, dtype=np.intp)
+    assignment[rng.permutation(n_cells)] = np.arange(n_cells) % k
+    return assignment, k
+
+
+def _block_totals(values, assignment, k, cell_weights):
+    """Per-prompt weighted sums and counts of non-missing scores in each block: (P, k) each"""
+    mask = ~np.isnan(values) * cell_weights
+    filled = np.where(mask > 0, values, 0.0) * cell_weights
+    n_prompts = values.shape[0]
+    index = (np.arange(n_prompts)[:, None] * k + assignment[None, :]).ravel()
+    sums = np.bincount(index, weights=filled.ravel(), minlength=n_prompts * k).reshape(n_prompts, k)
+    counts = np.bincount(index, weights=mask.ravel(), minlength=n_prompts * k).reshape(n_prompts, k)
+    return sums, counts
+
+
+def bootstrap_ci(sums, counts, n_boot, confidence, rng):
+    """Poisson-bootstrap confidence interval of each prompt's mean from block totals"""
+    weights = rng.poisson(1.0, size=(n_boot, sums.shape[1])).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        boot_means = (weights @ sums.T) / (weights @ counts.T)
+    alpha = (1 - confidence) / 2
+    # Prompts without any score give all-NaN columns (NaN bounds); don't warn about them
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(boot_means, [alpha, 1 - alpha], axis=0)
+    return low, high
+
+
+def paired_test(a, b, assignment, k, signs, cell_weights):
+    """Paired sign-flip permutation test of the weighted mean(a - b) == 0 over cells
+    scored for both. `signs` is an (n_perm × k) matrix of random ±1 block signs, drawn
+    once and shared by every comparison of a summary.
+
+    Returns (mean difference, two-sided p-value).
+    """
+    both = ~np.isnan(a) & ~np.isnan(b)
+    n = (both * cell_weights).sum()
+    if n == 0:
+        return float('nan'), 1.0
+    diff = np.where(both, a - b, 0.0) * cell_weights
+    block_diff = np.bincount(assignment, weights=diff, minlength=k)
+    observed = block_diff.sum() / n
+    null = np.abs(signs @ block_diff) / n
+    p_value = (1 + np.count_nonzero(null >= abs(observed) - 1e-12)) / (len(signs) + 1)
+    return float(observed), float(p_value)
+
+
+def holm_adjust(p_values):
+    """Holm-Bonferroni adjusted p-values (same order as the input)"""
+    p = np.asarray(p_values, dtype=float)
+    order = np.argsort(p)
+    m = len(p)
+    adjusted = np.empty(m)
+    adjusted[order] = np.minimum(1.0, np.maximum.accumulate(p[order] * (m - np.arange(m))))
+    return adjusted
+
+
+def summarize(scores, names, categories=None, weights=None, n_boot=1000, confidence=0.95,
+              alpha=0.05, success_threshold=0.99, seed=0, rank_key=None, leader=None):
+    """Aggregate a (prompt × persona × sample) score array.
+
+    `weights` (one per persona, e.g. near-duplicate cluster sizes) reweights every
+    statistic; 'count' stays the number of scored cells.
+    `rank_key(i, mean)` can break ties between prompts with equal means (higher wins).
+    `leader` overrides the choice of the leader (e.g. by rating) when it has scores.
+    The leader is tested against every other prompt with a paired permutation test
+    (Holm-corrected); it is only declared the winner when it is significantly better than
+    every other prompt on the cells both have scored.
+    """
+    rng = np.random.default_rng(seed)
+    n_prompts = scores.shape[0]
+    flat = scores.reshape(n_prompts, -1)
+    mask = ~np.isnan(flat)
+    persona_weights = np.ones(scores.shape[1]) if weights is None else np.asarray(weights, dtype=float)
+    cell_weights = np.repeat(persona_weights, scores.shape[2])
+
+    count = mask.sum(axis=1)
+    weighted_count = (mask * cell_weights).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (np.where(mask, flat, 0.0) * cell_weights).sum(axis=1) / weighted_count
+        success_rate = ((mask & (np.nan_to_num(flat) >= success_threshold)) * cell_weights).sum(axis=1) / weighted_count
+
+    assignment, k = _assign_blocks(flat.shape[1], rng)
+    sums, counts = _block_totals(flat, assignment, k, cell_weights)
+    ci_low, ci_high = bootstrap_ci(sums, counts, n_boot, confidence, rng)
+
+    category_means = {}
+    if categories is not None:
+        categories = np.asarray(categories)
+        for category in dict.fromkeys(categories.tolist()):
+            selected = categories == category
+            subset = scores[:, selected, :].reshape(n_prompts, -1)
+            sub_weights = np.repeat(persona_weights[selected], scores.shape[2])
+            sub_mask = ~np.isnan(subset) * sub_weights
+            with np.errstate(invalid='ignore', divide='ignore'):
+                category_means[category] = (np.where(sub_mask > 0, subset, 0.0) * sub_weights).sum(axis=1) / sub_mask.sum(axis=1)
+
+    scored = [i for i in range(n_prompts) if count[i]]
+    winner = None
+    tests = []
+    if scored:
+        def key(i):
+            return (mean[i],) + (tuple(rank_key(i, mean[i])) if rank_key else ())
+        winner = leader if leader in scored else max(scored, key=key)
+        others = sorted((i for i in scored if i != winner), key=key, reverse=True)
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(n_boot, k))
+        results = [paired_test(flat[winner], flat[i], assignment, k, signs, cell_weights) for i in others]
+        adjusted = holm_adjust([p for _, p in results]) if results else []
+        tests = [{'index': i, 'name': names[i], 'diff': d, 'p_value': p, 'p_adjusted': float(p_adj),
+                  'better': bool(d > 0 and p_adj < alpha)}
+                 for i, (d, p), p_adj in zip(others, results, adjusted)]
+
+    return {
+        'names': list(names),
+        'count': count,
+        'mean': mean,
+        'success_rate': success_rate,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'confidence': confidence,
+        'alpha': alpha,
+        'category_means': category_means,
+        'winner': winner,
+        'tests': tests,
+        # Two-sided tests, so a significant difference only counts in the leader's favour
+        'significant': bool(tests) and all(t['better'] for t in tests),
+    }
+
+
+def print_category_breakdown(summary, order=None):
+    """Print mean score per prompt and persona category"""
+    categories = list(summary['category_means'])
+    if not categories:
+        return
+    order = order if order is not None else range(len(summary['names']))
+    labels = [c.replace('_', ' ').title()[:16] for c in categories]
+    print(f"{'Prompt':<12} " + " ".join(f"{label:>16}" for label in labels))
+    for i in order:
+        values = " ".join(f"{summary['category_means'][c][i]:>16.3f}" for c in categories)
+        print(f"{summary['names'][i]:<12} {values}")
+
+
+def print_significance(summary, diff_format='+.3f'):
+    """Print the paired tests between the leader and the runners-up"""
+    if summary['winner'] is None:
+        return
+    leader = summary['names'][summary['winner']]
+    for test in summary['tests']:
+        if test['p_adjusted'] >= summary['alpha']:
+            verdict = "not significant"
+        else:
+            verdict = "significant" if test['better'] else "significantly worse"
+        print(f"   • {leader.upper()} vs {test['name'].upper()}: Δ={test['diff']:{diff_format}}, "
+              f"p={test['p_value']:.3f} (Holm-adjusted {test['p_adjusted']:.3f}, {verdict})")
@@ -0,0 +1,165 @@
+"""
+Structured outputs: request movie recommendations as JSON constrained to a schema, fall back
+to bounded repair retries for models without response_format support, and count invalid
+outputs per system prompt
+"""
+import json
+import threading
+
+# The {movies: [{title, genre, reason}]} shape every system prompt asks for
+MOVIES_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'movies': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'genre': {'type': 'string'},
+                    'reason': {'type': 'string'},
+                },
+                'required': ['title', 'genre', 'reason'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['movies'],
+    'additionalProperties': False,
+}
+
+RESPONSE_FORMAT = {
+    'type': 'json_schema',
+    'json_schema': {'name': 'movie_recommendations', 'strict': True, 'schema': MOVIES_SCHEMA},
+}
+
+REPAIR_INSTRUCTION = (
+    "Your previous reply was not valid JSON in the required format. Reply again with only a JSON "
+    'object of the form {"movies": [{"title": "...", "genre": "...", "reason": "..."}]} '
+    "and no markdown or other text."
+)
+
+
+def parse_json_output(output):
+    """Parse a model output as JSON, stripping markdown code fences only when the output
+    does not parse as is (schema-constrained output always does).
+    Raises json.JSONDecodeError for unparseable or missing output (e.g. a refusal)."""
+    if output is None:
+        raise json.JSONDecodeError("No output content", "", 0)
+    try:
+        return json.loads(output)
+    except json.JSONDecodeError:
+        pass
+    cleaned = output.strip()
+    if cleaned.startswith('```json'):
+        cleaned = cleaned.replace('```json', '').replace('```', '').strip()
+    elif cleaned.startswith('```'):
+        cleaned = cleaned.replace('```', '').strip()
+    return json.loads(cleaned)
+
+
+def is_valid_output(output):
+    """True when the output parses to the {movies: [{title, genre, reason}]} shape"""
+    try:
+        parsed = parse_json_output(output)
+    except json.JSONDecodeError:
+        return False
+    movies = parsed.get('movies') if isinstance(parsed, dict) else None
+    return isinstance(movies, list) and all(
+        isinstance(movie, dict) and all(field in movie for field in ('title', 'genre', 'reason'))
+        for movie in movies
+    )
+
+
+def is_unsupported_error(error):
+    """True when the API rejected the request because the model lacks response_format
+    (or json_schema) support"""
+    message = str(error).lower()
+    return (getattr(error, 'status_code', None) == 400
+            and ('response_format' in message or 'json_schema' in message))
+
+
+class StructuredOutput:
+    """Generate recommendations as JSON and count invalid outputs per system prompt.
+
+    When enabled, generations request `response_format` with MOVIES_SCHEMA. A model that
+    rejects it is remembered and gets plain generations instead; any invalid output is
+    then re-asked at most `repair_attempts` times with the invalid reply and a repair
+    instruction. When disabled, generations are plain and only their validity is counted,
+    which gives the baseline invalid-output rate.
+    """
+
+    def __init__(self, enabled=False, repair_attempts=1):
+        self.enabled = enabled
+        self.repair_attempts = repair_attempts
+        self._lock = threading.Lock()
+        self._unsupported = set()
+        self._prompts = {}
+
+    def generate(self, create, model, messages, prompt=None):
+        """Return the response of `create(messages, **kwargs)` (one chat completion),
+        repaired if needed; `prompt` is the system prompt the counts are recorded under"""
+        structured = self.enabled and model not in self._unsupported
+        if structured:
+            try:
+                response = create(messages, response_format=RESPONSE_FORMAT)
+            except Exception as e:
+                if not is_unsupported_error(e):
+                    raise
+                with self._lock:
+                    first = model not in self._unsupported
+                    self._unsupported.add(model)
+                if first:
+                    print(f"  ⚠️ {model} does not support structured outputs; using repair retries instead")
+                structured = False
+        if not structured:
+            response = create(messages)
+
+        output = response.choices[0].message.content
+        first_valid = valid = is_valid_output(output)
+        repair_calls = repair_tokens = 0
+        while self.enabled and not valid and repair_calls < self.repair_attempts:
+            repair_calls += 1
+            usage = getattr(response, 'usage', None)
+            repair_tokens += usage.total_tokens if usage else 0
+            response = create(messages + [{"role": "assistant", "content": output or ""},
+                                          {"role": "user", "content": REPAIR_INSTRUCTION}])
+            output = response.choices[0].message.content
+            valid = is_valid_output(output)
+
+        with self._lock:
+            stats = self._prompts.setdefault(prompt, {'outputs': 0, 'invalid': 0, 'repaired': 0,
+                                                      'repair_calls': 0, 'repair_tokens': 0})
+            stats['outputs'] += 1
+            stats['invalid'] += not first_valid
+            stats['repaired'] += valid and not first_valid
+            stats['repair_calls'] += repair_calls
+            stats['repair_tokens'] += repair_tokens
+        return response
+
+    def mode(self):
+        """How generations are requested: 'off', 'json_schema' or the repair fallback"""
+        if not self.enabled:
+            return 'off'
+        if self._unsupported:
+            return f"json_schema, repair retries for {', '.join(sorted(self._unsupported))}"
+        return 'json_schema'
+
+    def report(self):
+        """Per system prompt: outputs, invalid (first attempt), repaired, repair_calls,
+        repair_tokens (spent on the replaced invalid outputs) and invalid_rate"""
+        with self._lock:
+            return {prompt: dict(stats, invalid_rate=stats['invalid'] / stats['outputs'])
+                    for prompt, stats in self._prompts.items()}
+
+
+def print_validity_report(report, mode='off'):
+    """Print the invalid-output rate per system prompt"""
+    if not report:
+        return
+    print(f"\n🧩 OUTPUT VALIDITY (structured outputs: {mode}):")
+    print(f"   {'System prompt':<24} {'Outputs':>8} {'Invalid':>8} {'Rate':>7} {'Repaired':>9} "
+          f"{'Repairs':>8} {'Wasted tokens':>14}")
+    for prompt, stats in sorted(report.items(), key=lambda item: -item[1]['invalid_rate']):
+        print(f"   {str(prompt):<24} {stats['outputs']:>8} {stats['invalid']:>8} {stats['invalid_rate']:>7.1%} "
+              f"{stats['repaired']:>9} {stats['repair_calls']:>8} {stats['repair_tokens']:>14}")
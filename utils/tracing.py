@@ -0,0 +1,71 @@
+"""
+Lightweight span tracing that writes Chrome trace-event JSON (open in chrome://tracing or Perfetto)
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Tracer:
+    """Record timed spans from any thread"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    @contextmanager
+    def span(self, name, cat='phase', **attrs):
+        """Time the enclosed block; the yielded dict can receive extra attributes"""
+        start = self._now_us()
+        try:
+            yield attrs
+        finally:
+            end = self._now_us()
+            thread = threading.current_thread()
+            with self._lock:
+                self._threads[thread.ident] = thread.name
+                self._events.append({
+                    'name': name, 'cat': cat, 'ph': 'X',
+                    'ts': start, 'dur': end - start,
+                    'pid': os.getpid(), 'tid': thread.ident,
+                    'args': {k: v for k, v in attrs.items() if v is not None},
+                })
+
+    def write(self, path):
+        """Write the recorded spans as a Chrome trace-event JSON file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                         'args': {'name': name}} for tid, name in self._threads.items()]
+            events = metadata + sorted(self._events, key=lambda e: e['ts'])
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+_tracer = None
+
+
+def enable_tracing():
+    """Start recording spans process-wide and return the tracer"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+@contextmanager
+def span(name, cat='phase', **attrs):
+    """Record a span on the active tracer; a no-op when tracing is disabled"""
+    if _tracer is None:
+        yield attrs
+        return
+    with _tracer.span(name, cat, **attrs) as span_attrs:
+        yield span_attrs